@@ -1,33 +1,155 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from dotenv import load_dotenv
 import os
 import sys
-import requests
-import base64
-import sys
-
-# Ensure the api/ directory is on the Python path for Vercel
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
+import threading
 
 # Ensure the api/ directory is on the Python path for Vercel
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from services.youtube_service import YouTubeService
-from services.ai_service import AIService
-
-# Load environment variables
-load_dotenv()
+# Load environment variables. Vercel injects them into the process directly,
+# so python-dotenv is only imported for local runs.
+if not os.getenv('VERCEL'):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Initialize Flask app
 app = Flask(__name__)
 cors_origin = os.getenv("VITE_API_URL") or os.getenv("VERCEL_URL") or "*"
 CORS(app, resources={r"/api/*": {"origins": cors_origin}})
 
-# Initialize services
-youtube_service = YouTubeService()
-ai_service = AIService()
+# Services are constructed on first use so a cold start (e.g. /api/health)
+# does not pay for importing google-genai / googleapiclient. The lock is
+# reentrant because getters build their dependencies through other getters.
+_services_lock = threading.RLock()
+_youtube_service = None
+_ai_service = None
+_analysis_store = None
+_job_queue = None
+_admission = None
+_user_quotas = None
+_search_index = None
+_expression_corpus = None
+_related_index = None
+_analysis_pipeline = None
+
+
+def get_youtube_service():
+    """Return the shared YouTubeService, creating it on first use."""
+    global _youtube_service
+    if _youtube_service is None:
+        with _services_lock:
+            if _youtube_service is None:
+                from services.youtube_service import YouTubeService
+                _youtube_service = YouTubeService()
+    return _youtube_service
+
+
+def get_ai_service():
+    """Return the shared AIService, creating it on first use."""
+    global _ai_service
+    if _ai_service is None:
+        with _services_lock:
+            if _ai_service is None:
+                from services.ai_service import AIService
+                _ai_service = AIService()
+    return _ai_service
+
+
+def get_analysis_store():
+    """Return the shared AnalysisStore, creating it on first use."""
+    global _analysis_store
+    if _analysis_store is None:
+        with _services_lock:
+            if _analysis_store is None:
+                from services.analysis_store import AnalysisStore
+                _analysis_store = AnalysisStore()
+    return _analysis_store
+
+
+def get_job_queue():
+    """Return the shared JobQueue, creating it on first use."""
+    global _job_queue
+    if _job_queue is None:
+        with _services_lock:
+            if _job_queue is None:
+                from services.job_queue import JobQueue
+                _job_queue = JobQueue(get_analysis_store())
+    return _job_queue
+
+
+def get_admission():
+    """Return the shared AdmissionController, creating it on first use."""
+    global _admission
+    if _admission is None:
+        with _services_lock:
+            if _admission is None:
+                from services.admission import AdmissionController
+                _admission = AdmissionController(get_analysis_store())
+    return _admission
+
+
+def get_user_quotas():
+    """Return the shared UserQuotas, creating it on first use."""
+    global _user_quotas
+    if _user_quotas is None:
+        with _services_lock:
+            if _user_quotas is None:
+                from services.user_quotas import UserQuotas
+                _user_quotas = UserQuotas(get_analysis_store())
+    return _user_quotas
+
+
+def get_search_index():
+    """Return the shared SearchIndex, creating it (and catching up) on first use."""
+    global _search_index
+    if _search_index is None:
+        with _services_lock:
+            if _search_index is None:
+                from services.search_index import SearchIndex
+                search_index = SearchIndex(get_analysis_store())
+                search_index.sync()
+                _search_index = search_index
+    return _search_index
+
+
+def get_expression_corpus():
+    """Return the shared ExpressionCorpus, creating it (and catching up) on first use."""
+    global _expression_corpus
+    if _expression_corpus is None:
+        with _services_lock:
+            if _expression_corpus is None:
+                from services.expression_corpus import ExpressionCorpus
+                expression_corpus = ExpressionCorpus(get_analysis_store())
+                expression_corpus.sync()
+                _expression_corpus = expression_corpus
+    return _expression_corpus
+
+
+def get_related_index():
+    """Return the shared RelatedIndex, creating it (and catching up) on first use."""
+    global _related_index
+    if _related_index is None:
+        with _services_lock:
+            if _related_index is None:
+                from services.related_index import RelatedIndex
+                related_index = RelatedIndex(get_analysis_store())
+                related_index.sync()
+                _related_index = related_index
+    return _related_index
+
+
+def get_analysis_pipeline():
+    """Return the shared AnalysisPipeline, creating it on first use."""
+    global _analysis_pipeline
+    if _analysis_pipeline is None:
+        with _services_lock:
+            if _analysis_pipeline is None:
+                from services.analysis_pipeline import AnalysisPipeline
+                _analysis_pipeline = AnalysisPipeline(
+                    get_youtube_service(), get_ai_service(), get_expression_corpus(), get_analysis_store()
+                )
+    return _analysis_pipeline
 
 
 @app.route('/api/health', methods=['GET'])
@@ -36,12 +158,33 @@ def health_check():
     return jsonify({"status": "healthy", "message": "PM-ENG API is running"})
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Runtime metrics: connection pools, pipeline stages, model latency and tokens, admission, Vertex endpoints."""
+    from services.http_pool import pool_stats
+    from services.pipeline import pipeline_stats
+    from services.model_router import latency_tracker
+    from services.token_budget import token_budget
+    return jsonify({
+        "http_pool": pool_stats(),
+        "pipeline": pipeline_stats(),
+        "model_latency": latency_tracker.stats(),
+        "tokens": token_budget.stats(),
+        # Only once an analysis has created the AI service (and its clients)
+        "admission": _admission.stats() if _admission else None,
+        "vertex_pool": _ai_service.pool.stats() if _ai_service else None
+    })
+
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_video():
     """
     Analyze a YouTube video for PM insights and English expressions.
     """
     try:
+        youtube_service = get_youtube_service()
+        analysis_store = get_analysis_store()
+
         data = request.get_json()
         youtube_url = data.get('youtube_url')
         
@@ -58,48 +201,94 @@ def analyze_video():
             }), 400
         
         video_id = youtube_service.extract_video_id(youtube_url)
-        video_metadata = youtube_service.get_video_metadata(video_id)
         
+        refresh = data.get('refresh')
+        refresh = refresh if isinstance(refresh, list) else bool(refresh)
+        
+        # Latency profile: per request, else the deployment default
+        from services.profiles import get_profile
         try:
-            transcript_result = youtube_service.get_transcript(video_id)
+            profile = get_profile(data.get('profile'))
         except ValueError as e:
             return jsonify({
                 "success": False,
                 "error": str(e)
             }), 400
         
-        # Analyze for PM insights
-        try:
-            pm_insights = ai_service.analyze_pm_insights(
-                transcript_text=transcript_result.get('full_text'),
-                video_title=None,
-                video_url=youtube_url if transcript_result.get('fallback_needed') else None
-            )
-        except ValueError as e:
+        # With "synthesis": true the response is NDJSON: the analysis first,
+        # then the synthesis section once it is ready.
+        def respond(analysis):
+            if data.get('synthesis'):
+                return Response(
+                    stream_with_context(get_analysis_pipeline().stream_sections(analysis, profile, refresh=refresh)),
+                    mimetype='application/x-ndjson'
+                )
+            return jsonify(analysis)
+        
+        if not refresh:
+            stored = analysis_store.get(video_id)
+            # An explicitly requested profile is only served from a matching analysis
+            stored_profile = (stored['analysis'].get('profile') or {}).get('name') if stored else None
+            if stored and (not data.get('profile') or stored_profile == profile['name']):
+                return respond(stored['analysis'])
+        
+        from services.analysis_pipeline import STAGE_ERROR_LABELS
+        from services.pipeline import StageError
+        from services.transcript_digest import estimate_tokens
+        from services.user_quotas import user_key_for
+        
+        # Per-user daily quotas only count analyses that reach Gemini
+        user_key = user_key_for(forwarded_for=request.headers.get('X-Forwarded-For'),
+                                remote_addr=request.remote_addr)
+        reset_in = get_user_quotas().exceeded(user_key)
+        if reset_in:
             return jsonify({
                 "success": False,
-                "error": f"PM insights analysis failed: {str(e)}"
-            }), 500
+                "error": "Daily analysis quota reached. Stored analyses remain available.",
+                "retry_after": reset_in
+            }), 429, {"Retry-After": str(reset_in)}
+        
+        # Bound concurrent analyses (stored analyses above never wait): a
+        # full queue is shed at once rather than slowing everyone down.
+        # Waiting requests are served round-robin across users.
+        ticket = get_admission().acquire(user_key)
+        if ticket is None:
+            retry_after = get_admission().retry_after()
+            return jsonify({
+                "success": False,
+                "error": "The server is busy analyzing other videos. Please retry shortly.",
+                "retry_after": retry_after
+            }), 503, {"Retry-After": str(retry_after)}
         
-        # Analyze for English expressions
+        # Stages run as a DAG: fetches in parallel, then both analyses in
+        # parallel. A list "refresh" re-runs only the named stages.
         try:
-            english_expressions = ai_service.analyze_english_expressions(
-                transcript_text=transcript_result.get('full_text'),
-                video_id=video_id,
-                video_url=youtube_url if transcript_result.get('fallback_needed') else None
+            result, transcript_result, _ = get_analysis_pipeline().run(
+                video_id,
+                profile,
+                refresh=refresh
             )
-        except ValueError as e:
+        except StageError as e:
+            if e.stage == 'captions':
+                return jsonify({
+                    "success": False,
+                    "error": str(e)
+                }), 400
+            label = STAGE_ERROR_LABELS.get(e.stage, f"Stage {e.stage}")
             return jsonify({
                 "success": False,
-                "error": f"English expression analysis failed: {str(e)}"
+                "error": f"{label} failed: {str(e)}"
             }), 500
+        finally:
+            get_admission().release(ticket)
         
-        return jsonify({
-            "success": True,
-            "video": video_metadata,
-            "pm_insights": pm_insights,
-            "english_expressions": english_expressions
-        })
+        analysis_store.save(video_id, result, transcript=transcript_result.get('transcript'))
+        get_user_quotas().record(user_key, requests=1, tokens=estimate_tokens(transcript_result.get('full_text')))
+        get_search_index().index_analysis(video_id)
+        get_expression_corpus().add_analysis(video_id)
+        get_related_index().add_analysis(video_id)
+        
+        return respond(result)
         
     except Exception as e:
         return jsonify({
@@ -108,10 +297,108 @@ def analyze_video():
         }), 500
 
 
+@app.route('/api/analysis/<video_id>', methods=['GET'])
+def get_analysis(video_id):
+    """Return a stored analysis, with ETag/Last-Modified and compression."""
+    from services.http_cache import cached_json_response
+
+    stored = get_analysis_store().get(video_id)
+    if not stored:
+        return jsonify({
+            "success": False,
+            "error": "No analysis found for this video"
+        }), 404
+    
+    return cached_json_response(
+        request,
+        stored['payload_json'],
+        etag=stored['etag'],
+        last_modified=stored['updated_at']
+    )
+
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """
+    Full-text search over stored transcripts, PM insights and expressions.
+    
+    Query params: q (required), limit (default 20, max 100), kind
+    (transcript | insight | expression). Never calls the LLM.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({
+            "success": False,
+            "error": "Query parameter q is required"
+        }), 400
+    
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    results = get_search_index().search(query, limit=limit, kind=request.args.get('kind'))
+    return jsonify({
+        "success": True,
+        "query": query,
+        "results": results
+    })
+
+
+@app.route('/api/related/<video_id>', methods=['GET'])
+def related_videos(video_id):
+    """
+    Previously analyzed videos most similar to this one (TF-IDF cosine over
+    transcripts and insights). Never calls the LLM.
+    
+    Query params: limit (default 10, max 50). For a video that has not been
+    analyzed yet (e.g. while its analysis is running), matches on its title.
+    """
+    related_index = get_related_index()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    results = related_index.related(video_id, limit=limit)
+    if results is None:
+        title = get_youtube_service().get_video_metadata(video_id).get('title')
+        results = related_index.related_to_text(title, limit=limit, exclude=video_id) if title else []
+    return jsonify({
+        "success": True,
+        "video_id": video_id,
+        "related": results
+    })
+
+
+@app.route('/api/expressions', methods=['GET'])
+def browse_expressions():
+    """
+    Browse the cross-video expression corpus, most frequent first.
+    
+    Query params: q (optional filter), limit (default 50, max 200), offset.
+    """
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    expressions = get_expression_corpus().browse(
+        query=request.args.get('q'),
+        limit=limit,
+        offset=max(0, request.args.get('offset', 0, type=int))
+    )
+    return jsonify({
+        "success": True,
+        "expressions": expressions
+    })
+
+
+@app.route('/api/expressions/known', methods=['GET'])
+def known_expressions():
+    """Expressions that are excluded from new analyses as already known."""
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    return jsonify({
+        "success": True,
+        "expressions": get_expression_corpus().known_phrases(limit=limit)
+    })
+
+
 @app.route('/api/notion/auth', methods=['POST'])
 def notion_auth():
     """Exchange Notion OAuth code for an access token."""
     try:
+        import base64
+        from services.http_pool import get_session
+
         data = request.get_json()
         code = data.get('code')
         
@@ -128,7 +415,7 @@ def notion_auth():
         credentials = f"{client_id}:{client_secret}"
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
 
-        response = requests.post(
+        response = get_session().post(
             "https://api.notion.com/v1/oauth/token",
             headers={
                 "Authorization": f"Basic {encoded_credentials}",
@@ -138,7 +425,8 @@ def notion_auth():
                 "grant_type": "authorization_code",
                 "code": code,
                 "redirect_uri": redirect_uri
-            }
+            },
+            timeout=30
         )
         
         token_data = response.json()
@@ -165,9 +453,25 @@ def notion_auth():
 
 @app.route('/api/export/notion', methods=['POST'])
 def export_to_notion():
-    """Export analysis data to a user's Notion page."""
+    """
+    Export analysis data to a user's Notion page.
+    
+    Expected JSON body:
+    {
+        "access_token": "...",
+        "analysis_id": "VIDEO_ID",    # preferred: resolved from the analysis store
+        "analysis_data": {...},       # legacy: full analysis payload
+        "wait": false                 # optional, export synchronously
+    }
+    
+    By default the export runs as a background job and 202 is returned with
+    a job_id to poll at /api/jobs/<job_id>. Exporting an analysis that was
+    exported before updates the existing Notion page instead of creating
+    a new one.
+    """
     try:
         data = request.get_json()
+        analysis_id = data.get('analysis_id')
         analysis_data = data.get('analysis_data')
         access_token = data.get('access_token')
         
@@ -177,37 +481,159 @@ def export_to_notion():
                 "error": "Notion access token is required"
             }), 401
             
+        from services.notion_export import resolve_export_payload, export_analysis_job, export_job_key
+        
+        try:
+            analysis_data, blocks = resolve_export_payload(get_analysis_store(), analysis_id, analysis_data)
+        except LookupError as e:
+            # Distinct from Notion's 404s: the client may resend the payload
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "error_code": "analysis_not_found"
+            }), 404
+        
         if not analysis_data:
             return jsonify({
                 "success": False,
-                "error": "analysis_data is required"
+                "error": "analysis_id or analysis_data is required"
             }), 400
-            
+        
+        def run_export(report_progress):
+            return export_analysis_job(get_analysis_store(), access_token, analysis_id, analysis_data, blocks, report_progress)
+        
+        job_key = export_job_key(access_token, analysis_id)
+        params = {"analysis_id": analysis_id}
+        
+        if data.get('wait', bool(os.getenv('VERCEL'))):
+            try:
+                job_id, result = get_job_queue().run_inline('notion_export', run_export, job_key=job_key, params=params)
+            except ValueError as e:
+                # No page shared with the integration
+                return jsonify({
+                    "success": False,
+                    "error": str(e)
+                }), 404
+            return jsonify({
+                "success": True,
+                "job_id": job_id,
+                "notion_url": result['notion_url'],
+                "mode": result['mode']
+            })
+        
+        # Re-exports of the same analysis attach to the job already in flight
+        job_id = get_job_queue().submit('notion_export', run_export, job_key=job_key, params=params)
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Failed to export to Notion: {str(e)}"
+        }), 500
+
+
+@app.route('/api/export/notion/bulk', methods=['POST'])
+def bulk_export_to_notion():
+    """
+    Export many stored analyses as rows of a Notion database in one job.
+    
+    Expected JSON body:
+    {
+        "access_token": "...",
+        "analysis_ids": ["VIDEO_ID", ...],
+        "database_id": "...",         # optional, created under the parent page if omitted
+        "resume_job_id": "...",       # optional, re-run an earlier bulk job
+        "wait": false                 # optional, run synchronously
+    }
+    
+    Returns 202 with a job_id; progress is reported at /api/jobs/<job_id>.
+    Rows that are already up to date are skipped, so resuming is cheap.
+    """
+    try:
+        data = request.get_json()
+        access_token = data.get('access_token')
+        
+        if not access_token:
+            return jsonify({
+                "success": False,
+                "error": "Notion access token is required"
+            }), 401
+        
         from services.notion_service import NotionService
-        user_notion_service = NotionService(auth_token=access_token)
+        from services.notion_export import bulk_export_job
+        
+        if data.get('resume_job_id'):
+            previous_job = get_job_queue().get(data['resume_job_id'])
+            if not previous_job or previous_job['kind'] != 'notion_bulk_export':
+                return jsonify({
+                    "success": False,
+                    "error": "Bulk export job not found"
+                }), 404
+            analysis_ids = previous_job['params']['analysis_ids']
+            database_id = previous_job['params']['database_id']
+        else:
+            analysis_ids = data.get('analysis_ids') or []
+            database_id = data.get('database_id')
         
-        pages = user_notion_service.search_pages()
-        if not pages:
+        if not analysis_ids:
             return jsonify({
                 "success": False,
-                "error": "No accessible pages found. Please share a page with the integration."
-            }), 404
-            
-        parent_page_id = pages[0]['id']
-        result = user_notion_service.create_analysis_page(parent_page_id, analysis_data)
+                "error": "analysis_ids is required"
+            }), 400
+        
+        if not database_id:
+            user_notion_service = NotionService(auth_token=access_token)
+            parent_page_id = user_notion_service.find_parent_page()
+            if not parent_page_id:
+                return jsonify({
+                    "success": False,
+                    "error": "No accessible pages found in Notion. Please share a page with the integration."
+                }), 404
+            database_id = user_notion_service.create_analysis_database(parent_page_id)['id']
+        
+        def run_bulk_export(report_progress):
+            return bulk_export_job(get_analysis_store(), access_token, analysis_ids, database_id, report_progress)
+        
+        params = {"analysis_ids": analysis_ids, "database_id": database_id}
+        job_key = f"notion-bulk:{database_id}"
         
+        if data.get('wait', bool(os.getenv('VERCEL'))):
+            job_id, result = get_job_queue().run_inline('notion_bulk_export', run_bulk_export, job_key=job_key, params=params)
+            return jsonify(dict(result, success=True, job_id=job_id))
+        
+        job_id = get_job_queue().submit('notion_bulk_export', run_bulk_export, job_key=job_key, params=params)
         return jsonify({
             "success": True,
-            "notion_url": result.get('url')
-        })
+            "job_id": job_id,
+            "database_id": database_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202
         
     except Exception as e:
         return jsonify({
             "success": False,
-            "error": f"Failed to export to Notion: {str(e)}"
+            "error": f"Failed to start bulk export: {str(e)}"
         }), 500
 
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and result of a background job."""
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({
+            "success": False,
+            "error": "Job not found"
+        }), 404
+    return jsonify(dict(job, success=True))
+
+
 if __name__ == '__main__':
     if not os.getenv('GOOGLE_API_KEY'):
         print("WARNING: GOOGLE_API_KEY not found in environment variables")
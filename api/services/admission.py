@@ -0,0 +1,193 @@
+import os
+import math
+import time
+import uuid
+import sqlite3
+import threading
+from collections import deque
+
+# Weight of the newest analysis in the running duration estimate behind Retry-After
+DURATION_ALPHA = 0.2
+
+
+class AdmissionController:
+    """
+    Bounds concurrent analyses so admitted requests keep a predictable
+    latency under load instead of every request slowing down together.
+
+    Up to ADMISSION_MAX_IN_FLIGHT analyses run per process and, when
+    ADMISSION_MAX_GLOBAL is set, across all processes sharing the analysis
+    database (slots are leased rows, so a crashed process frees its slots
+    after ADMISSION_SLOT_LEASE_SECONDS). Up to ADMISSION_MAX_QUEUE requests
+    wait for a slot for at most ADMISSION_MAX_QUEUE_SECONDS; anything beyond
+    that is rejected at once with a Retry-After estimate.
+
+    Waiting requests are queued per user and freed slots are handed out
+    round-robin across users (deficit round-robin with one analysis as the
+    quantum), so a user running a batch gets every other slot rather than
+    all of them. A user may hold at most ADMISSION_MAX_QUEUE_PER_USER places
+    in the queue, so one batch cannot shed everyone else's requests.
+    """
+
+    def __init__(self, store, max_in_flight=None, max_queue=None, max_queue_seconds=None, max_global=None,
+                 max_queue_per_user=None):
+        self.store = store
+        self.max_in_flight = max_in_flight or int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 4))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv('ADMISSION_MAX_QUEUE', 8))
+        self.max_queue_per_user = max_queue_per_user if max_queue_per_user is not None \
+            else int(os.getenv('ADMISSION_MAX_QUEUE_PER_USER', 2))
+        self.max_queue_seconds = max_queue_seconds if max_queue_seconds is not None \
+            else float(os.getenv('ADMISSION_MAX_QUEUE_SECONDS', 10))
+        self.max_global = max_global if max_global is not None else int(os.getenv('ADMISSION_MAX_GLOBAL', 0))
+        self.lease_seconds = float(os.getenv('ADMISSION_SLOT_LEASE_SECONDS', 600))
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._queues = {}       # user key -> deque of waiters
+        self._rotation = deque()  # users with waiters, in round-robin order
+        self._duration = None
+        self._counts = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+        if self.max_global:
+            with self.store.connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS admission_slots (
+                        slot_id TEXT PRIMARY KEY,
+                        acquired_at REAL NOT NULL
+                    )
+                """)
+
+    def _acquire_global(self):
+        """Lease a global slot. Returns its ID, or None if all are taken."""
+        conn = self.store.connection()
+        now = time.time()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM admission_slots WHERE acquired_at < ?", (now - self.lease_seconds,))
+            taken = conn.execute("SELECT COUNT(*) FROM admission_slots").fetchone()[0]
+            if taken >= self.max_global:
+                conn.execute("COMMIT")
+                return None
+            slot_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO admission_slots (slot_id, acquired_at) VALUES (?, ?)", (slot_id, now))
+            conn.execute("COMMIT")
+            return slot_id
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def _try_admit(self):
+        """Take a local (and global) slot if one is free; caller holds the condition."""
+        if self._in_flight >= self.max_in_flight:
+            return False, None
+        slot_id = None
+        if self.max_global:
+            slot_id = self._acquire_global()
+            if slot_id is None:
+                return False, None
+        self._in_flight += 1
+        return True, slot_id
+
+    def _dispatch(self):
+        """Hand free slots to waiters, one user at a time in turn; caller holds the condition."""
+        while self._rotation:
+            admitted, slot_id = self._try_admit()
+            if not admitted:
+                return
+            user_key = self._rotation.popleft()
+            waiter = self._queues[user_key].popleft()
+            if self._queues[user_key]:
+                self._rotation.append(user_key)
+            else:
+                del self._queues[user_key]
+            waiter["slot_id"] = slot_id
+            waiter["admitted"] = True
+            self._condition.notify_all()
+
+    def _withdraw(self, user_key, waiter):
+        """Remove a waiter that gave up; caller holds the condition."""
+        queue = self._queues[user_key]
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[user_key]
+            self._rotation.remove(user_key)
+
+    def acquire(self, user_key=None):
+        """
+        Admit one analysis, waiting in the user's queue if needed.
+
+        Args:
+            user_key: Who the analysis is for (fair-share key); anonymous if None
+
+        Returns:
+            Ticket to pass to release(), or None if the request was shed
+        """
+        user_key = user_key or 'anonymous'
+        started = time.time()
+        with self._condition:
+            # Nobody is waiting: take a free slot directly
+            admitted, slot_id = self._try_admit() if not self._rotation else (False, None)
+            if admitted:
+                self._counts["admitted"] += 1
+                return {"slot_id": slot_id, "started": time.time()}
+
+            queue = self._queues.get(user_key)
+            if self._waiting >= self.max_queue or (queue and len(queue) >= self.max_queue_per_user):
+                self._counts["rejected"] += 1
+                return None
+            waiter = {"admitted": False, "slot_id": None}
+            if queue is None:
+                queue = self._queues[user_key] = deque()
+                self._rotation.append(user_key)
+            queue.append(waiter)
+            self._waiting += 1
+            self._counts["queued"] += 1
+            try:
+                deadline = started + self.max_queue_seconds
+                while not waiter["admitted"]:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._withdraw(user_key, waiter)
+                        self._counts["timed_out"] += 1
+                        return None
+                    # Other processes never notify us; poll global slots
+                    self._condition.wait(min(remaining, 0.25) if self.max_global else remaining)
+                    if not waiter["admitted"] and self.max_global:
+                        self._dispatch()
+            finally:
+                self._waiting -= 1
+            self._counts["admitted"] += 1
+        return {"slot_id": waiter["slot_id"], "started": time.time()}
+
+    def release(self, ticket):
+        """Free the slot of a finished (or failed) analysis."""
+        if ticket["slot_id"]:
+            with self.store.connection() as conn:
+                conn.execute("DELETE FROM admission_slots WHERE slot_id = ?", (ticket["slot_id"],))
+        seconds = time.time() - ticket["started"]
+        with self._condition:
+            self._in_flight -= 1
+            self._duration = seconds if self._duration is None \
+                else DURATION_ALPHA * seconds + (1 - DURATION_ALPHA) * self._duration
+            self._dispatch()
+
+    def retry_after(self):
+        """Seconds a shed client should wait: the queue ahead drained at the recent analysis rate."""
+        with self._condition:
+            duration = self._duration if self._duration is not None else 30.0
+            return max(1, min(120, math.ceil(duration * (self._waiting + 1) / self.max_in_flight)))
+
+    def stats(self):
+        with self._condition:
+            return dict(
+                self._counts,
+                in_flight=self._in_flight,
+                waiting=self._waiting,
+                waiting_users=len(self._queues),
+                max_in_flight=self.max_in_flight,
+                max_queue=self.max_queue,
+                max_global=self.max_global or None,
+                avg_seconds=round(self._duration, 2) if self._duration is not None else None,
+            )
@@ -0,0 +1,326 @@
+import os
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from services.pipeline import Pipeline, Stage, StageCache, StageError, code_fingerprint
+from services.expression_prefilter import build_expression_candidates, group_windows
+from services.expression_corpus import normalize_phrase
+from services.transcript_digest import build_pm_digest, estimate_tokens
+from services.token_budget import token_budget
+from services.youtube_service import YouTubeService
+
+# Video metadata and captions rarely change; refresh them daily
+SOURCE_TTL = 24 * 3600
+
+# Parallel Gemini calls per chunked expression analysis
+MAX_CHUNK_WORKERS = 4
+
+# How failures of the model stages are reported to API clients
+STAGE_ERROR_LABELS = {
+    "transcript": "Video transcription",
+    "pm_insights": "PM insights analysis",
+    "english_expressions": "English expression analysis",
+}
+
+
+def video_clip():
+    """
+    Part of a caption-less video sent to Gemini for transcription:
+    VIDEO_FALLBACK_START_SECONDS (skip an intro) and VIDEO_FALLBACK_MAX_MINUTES
+    (cap long videos; 0 = to the end).
+    """
+    start = int(os.getenv('VIDEO_FALLBACK_START_SECONDS', 0))
+    max_minutes = float(os.getenv('VIDEO_FALLBACK_MAX_MINUTES', 0))
+    return {"start": start or None, "end": start + int(max_minutes * 60) if max_minutes else None}
+
+
+def transcription_clips(clip, duration):
+    """
+    (start, end) offsets of the pieces a caption-less video is transcribed
+    in: VIDEO_TRANSCRIBE_SEGMENT_MINUTES (10) each, so no single call runs
+    into the output token limit. One call for the whole clip when the
+    video's duration is unknown.
+    """
+    start = clip['start'] or 0
+    end = min(clip['end'] or duration, duration) if duration else clip['end']
+    segment_seconds = int(float(os.getenv('VIDEO_TRANSCRIBE_SEGMENT_MINUTES', 10)) * 60)
+    if not end or not segment_seconds:
+        return [(clip['start'], clip['end'])]
+    return [(offset or None, min(offset + segment_seconds, end)) for offset in range(start, end, segment_seconds)]
+
+
+def merge_chunk_expressions(chunk_results, limit=7):
+    """
+    Merge expressions found in separate transcript chunks: round-robin
+    across chunks so the whole video is covered, skipping duplicates.
+    """
+    merged, seen = [], set()
+    for rank in range(max((len(r) for r in chunk_results), default=0)):
+        for results in chunk_results:
+            if rank < len(results):
+                norm = normalize_phrase(results[rank].get('phrase'))
+                if norm not in seen:
+                    seen.add(norm)
+                    merged.append(results[rank])
+    return merged[:limit]
+
+
+class AnalysisPipeline:
+    """
+    The video analysis as a DAG of stages (see agents/architecture_overview.md):
+
+        metadata ──────────────────────────────────────────────────────┐
+        captions ─ transcript ─┬─ pm_text ─────────── pm_insights ───────┤
+                               ├─ fallback_url ──┘                        │
+                               └─ expression_chunks ─ english_expressions ┤─ result
+                                  known_phrases ───┘                      ┘
+        metadata + pm_insights + english_expressions ── synthesis (optional)
+
+    Metadata and caption fetches run in parallel, as do the two Gemini
+    calls. A video without captions is transcribed once by Gemini from the
+    video itself (low resolution, optionally clipped, in parallel segments);
+    the transcript is cached without expiry, so both analyses and any later
+    re-analysis take the text path instead of each ingesting the video. If
+    transcription fails, times out or is cut off, both analyses read the
+    video directly (fallback_url) and the next run tries transcribing again. Every model stage's cache key includes a fingerprint of the
+    method (and so its prompt) and the latency profile, so changing one
+    prompt only re-runs that stage. The "auto" profile is resolved by the
+    profile stage once the transcript is known.
+
+    Synthesis only sees the compact outputs of the two analyses, so it is
+    run on demand (also for stored analyses) and cached on its own.
+    """
+
+    def __init__(self, youtube_service, ai_service, expression_corpus, store):
+        self.youtube_service = youtube_service
+        self.ai_service = ai_service
+        self.expression_corpus = expression_corpus
+        self.pipeline = Pipeline(self.stages(), cache=StageCache(store))
+
+    def stages(self):
+        youtube_service, ai_service = self.youtube_service, self.ai_service
+
+        transcribe_timeout = float(os.getenv('VIDEO_TRANSCRIBE_TIMEOUT', 270))
+
+        def transcribe(video_url, clips):
+            executor = ThreadPoolExecutor(max_workers=min(len(clips), MAX_CHUNK_WORKERS),
+                                          thread_name_prefix='transcribe')
+            try:
+                futures = [executor.submit(ai_service.transcribe_video, video_url, start_seconds=start,
+                                           end_seconds=end) for start, end in clips]
+                _, pending = wait(futures, timeout=transcribe_timeout)
+                if pending:
+                    raise TimeoutError(f"{len(pending)} of {len(clips)} segments unfinished "
+                                       f"after {transcribe_timeout:g}s")
+                segments = [segment for future in futures for segment in future.result()]
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+            if not segments:
+                raise ValueError("No speech found in the video")
+            return segments
+
+        def transcript(captions, video_id, video_clip, video_duration):
+            if not captions.get('fallback_needed'):
+                return captions
+            video_url = f"https://www.youtube.com/watch?v={video_id}"
+            try:
+                segments = transcribe(video_url, transcription_clips(video_clip, video_duration))
+            except (ValueError, TimeoutError) as e:
+                print(f"DEBUG - Video transcription failed ({str(e)}); analyzing the video directly")
+                return dict(captions, video_url=video_url, source="video")
+            return {
+                "transcript": segments,
+                "full_text": "\n".join(
+                    f"{YouTubeService.format_timestamp(s['start'])} {s['text']}" for s in segments
+                ),
+                "language": None,
+                "source": "video",
+            }
+
+        def route_profile(requested_profile, transcript):
+            # "auto" picks model and strategy from transcript size and live latency
+            full_text = transcript.get('full_text')
+            profile, route = ai_service.route_profile(requested_profile, estimate_tokens(full_text) if full_text else 0)
+            return {"profile": profile, "route": route}
+
+        def pm_text(transcript, profile):
+            # Long transcripts are cut down to a token-budgeted extractive
+            # digest of their most central windows. Profiles that send the
+            # full transcript still get a digest when it exceeds their input budget.
+            full_text = transcript.get('full_text')
+            budget = profile['pm_digest_budget']
+            if not budget and full_text and token_budget.estimate(full_text, profile['model']) > profile['max_input_tokens']:
+                budget = profile['max_input_tokens']
+            if transcript.get('transcript') and budget and os.getenv('PM_DIGEST', '1') == '1':
+                digest = build_pm_digest(transcript['transcript'], token_budget=budget)
+                if digest['windows_kept'] < digest['windows_total']:
+                    print(f"DEBUG - PM digest: {digest['tokens']} of ~{digest['full_tokens']} tokens "
+                          f"({digest['windows_kept']}/{digest['windows_total']} windows)")
+                    return digest['text']
+            return full_text
+
+        def expression_chunks(transcript, profile):
+            # One text per parallel Gemini call. Only the caption windows most
+            # likely to hold expressions are sent, unless the profile says all.
+            segments = transcript.get('transcript')
+            if not segments:
+                return [transcript.get('full_text')]
+
+            def build(chunk_minutes):
+                chunks = group_windows(segments, chunk_minutes * 60) if chunk_minutes else [segments]
+                if profile['expression_ratio'] and os.getenv('EXPRESSION_PREFILTER', '1') == '1':
+                    return [build_expression_candidates(chunk, ratio=profile['expression_ratio']) for chunk in chunks]
+                return [
+                    "\n".join(f"{YouTubeService.format_timestamp(s.get('start', 0))} {s.get('text', '')}" for s in chunk)
+                    for chunk in chunks
+                ]
+
+            texts = build(profile['chunk_minutes'])
+            largest = max(token_budget.estimate(text, profile['model']) for text in texts)
+            if largest > profile['max_input_tokens']:
+                # Split finer, so that each parallel call fits the input budget
+                minutes = profile['chunk_minutes'] or (segments[-1].get('start', 0) + segments[-1].get('duration', 0)) / 60
+                texts = build(max(1, math.floor(minutes * profile['max_input_tokens'] / largest)))
+            return texts
+
+        def known_phrases(video_id):
+            # Phrases already seen across other videos are excluded
+            if os.getenv('EXPRESSION_EXCLUDE_KNOWN', '1') != '1':
+                return None
+            return self.expression_corpus.known_phrases(limit=int(os.getenv('EXPRESSION_EXCLUDE_LIMIT', 50)),
+                                                        exclude_video_id=video_id)
+
+        def pm_insights(pm_text, fallback_url, profile):
+            return ai_service.analyze_pm_insights(
+                transcript_text=pm_text,
+                video_title=None,
+                video_url=fallback_url,
+                profile=profile
+            )
+
+        def english_expressions(expression_chunks, video_id, fallback_url, known_phrases, profile):
+            def analyze(text):
+                return ai_service.analyze_english_expressions(
+                    transcript_text=text,
+                    video_id=video_id,
+                    video_url=fallback_url,
+                    exclude_phrases=known_phrases,
+                    profile=profile
+                )
+
+            if len(expression_chunks) == 1:
+                return analyze(expression_chunks[0])
+            with ThreadPoolExecutor(max_workers=min(len(expression_chunks), MAX_CHUNK_WORKERS),
+                                    thread_name_prefix='chunk') as pool:
+                return merge_chunk_expressions(list(pool.map(analyze, expression_chunks)))
+
+        def synthesis(metadata, pm_insights, english_expressions, profile):
+            return ai_service.synthesize_analysis(
+                video_metadata=metadata,
+                pm_insights=pm_insights,
+                english_expressions=english_expressions,
+                profile=profile
+            )
+
+        def result(video_id, metadata, pm_insights, english_expressions, profile, route):
+            reported = {"name": profile['name'], "model": profile['model']}
+            if route:
+                reported["route"] = route
+            return {
+                "success": True,
+                "analysis_id": video_id,
+                "video": metadata,
+                "pm_insights": pm_insights,
+                "english_expressions": english_expressions,
+                "profile": reported
+            }
+
+        return [
+            Stage('metadata', youtube_service.get_video_metadata, inputs=['video_id'], timeout=30, ttl=SOURCE_TTL),
+            Stage('captions', youtube_service.get_transcript, inputs=['video_id'], timeout=60, ttl=SOURCE_TTL),
+            Stage('video_duration', lambda metadata: metadata.get('duration_seconds'), inputs=['metadata'],
+                  cache=False),
+            Stage('transcript', transcript, inputs=['captions', 'video_id', 'video_clip', 'video_duration'],
+                  timeout=transcribe_timeout + 30, version=code_fingerprint(ai_service.transcribe_video),
+                  # A direct-video fallback is not kept, so the next run retries transcription
+                  cache_if=lambda outputs: not outputs['transcript'].get('fallback_needed')),
+            Stage('profile', route_profile, inputs=['requested_profile', 'transcript'], outputs=['profile', 'route'],
+                  cache=False),
+            Stage('pm_text', pm_text, inputs=['transcript', 'profile'], cache=False),
+            Stage('expression_chunks', expression_chunks, inputs=['transcript', 'profile'], cache=False),
+            Stage('fallback_url', lambda transcript: transcript.get('video_url'), inputs=['transcript'], cache=False),
+            Stage('known_phrases', known_phrases, inputs=['video_id'], cache=False),
+            Stage('pm_insights', pm_insights, inputs=['pm_text', 'fallback_url', 'profile'],
+                  version=code_fingerprint(ai_service.analyze_pm_insights)),
+            Stage('english_expressions', english_expressions,
+                  inputs=['expression_chunks', 'video_id', 'fallback_url', 'known_phrases', 'profile'],
+                  version=code_fingerprint(ai_service.analyze_english_expressions)),
+            Stage('synthesis', synthesis, inputs=['metadata', 'pm_insights', 'english_expressions', 'profile'],
+                  version=code_fingerprint(ai_service.synthesize_analysis)),
+            Stage('result', result,
+                  inputs=['video_id', 'metadata', 'pm_insights', 'english_expressions', 'profile', 'route'],
+                  cache=False),
+        ]
+
+    def run(self, video_id, profile, refresh=()):
+        """
+        Analyze one video.
+
+        Args:
+            video_id: YouTube video ID
+            profile: Requested latency profile dict (see services.profiles);
+                "auto" is routed once the transcript size is known
+            refresh: Stage names to re-run despite a cached output, or True for all
+
+        Returns:
+            Tuple of (result dict, transcript dict, per-stage metrics). The
+            result reports the profile used and the wall-clock seconds taken.
+
+        Raises:
+            StageError: If a stage failed or timed out (`.stage` names it)
+        """
+        started = time.perf_counter()
+        values, metrics = self.pipeline.run(
+            {"video_id": video_id, "video_clip": video_clip(), "requested_profile": profile},
+            targets=['result', 'transcript'],
+            refresh=refresh
+        )
+        result = values['result']
+        result['profile']['seconds'] = round(time.perf_counter() - started, 2)
+        return result, values['transcript'], metrics
+
+    def synthesize(self, analysis, profile, refresh=()):
+        """
+        Synthesis for a finished analysis, served from the stage cache when
+        the analysis has not changed.
+
+        Returns:
+            Tuple of (synthesis dict, per-stage metrics)
+        """
+        profile, _ = self.ai_service.route_profile(profile, 0)
+        values, metrics = self.pipeline.run(
+            {
+                "metadata": analysis.get('video'),
+                "pm_insights": analysis.get('pm_insights'),
+                "english_expressions": analysis.get('english_expressions'),
+                "profile": profile,
+            },
+            targets=['synthesis'],
+            refresh=refresh
+        )
+        return values['synthesis'], metrics
+
+    def stream_sections(self, analysis, profile, refresh=()):
+        """
+        NDJSON lines for a streamed /api/analyze response: the analysis goes
+        out first, then the synthesis once it is ready (or its error).
+        """
+        yield json.dumps({"section": "analysis", "data": analysis}, separators=(',', ':')) + "\n"
+        try:
+            synthesis, _ = self.synthesize(analysis, profile, refresh=refresh)
+            yield json.dumps({"section": "synthesis", "data": synthesis}, separators=(',', ':')) + "\n"
+        except StageError as e:
+            yield json.dumps({"section": "synthesis", "error": f"Synthesis failed: {str(e)}"},
+                             separators=(',', ':')) + "\n"
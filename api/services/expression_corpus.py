@@ -0,0 +1,193 @@
+import os
+import re
+import time
+import unicodedata
+
+# Leading words that do not change which expression it is ("to move the needle")
+_LEADING_FILLERS = ('to ', 'a ', 'an ', 'the ')
+
+
+def normalize_phrase(phrase):
+    """
+    Canonical form used to dedupe expressions across videos:
+    lowercased, accents folded, hyphens and punctuation turned into spaces,
+    leading fillers dropped. "Double-click on..." -> "double click on".
+    """
+    text = unicodedata.normalize('NFKD', phrase or '').encode('ascii', 'ignore').decode('ascii')
+    text = re.sub(r"[^a-z0-9' ]+", ' ', text.lower().replace('-', ' '))
+    text = re.sub(r'\s+', ' ', text).strip(" '")
+    for filler in _LEADING_FILLERS:
+        if text.startswith(filler) and len(text) > len(filler) + 3:
+            text = text[len(filler):]
+    return text
+
+
+class ExpressionCorpus:
+    """
+    Deduplicated index of English expressions across all stored analyses,
+    with frequency and example occurrences, kept in the analysis database.
+
+    The known phrases handed to new analyses come from a snapshot of the
+    corpus taken at most every EXPRESSION_EXCLUDE_REFRESH_SECONDS (one day),
+    so they (and the cache keys of the stages that use them) do not change
+    with every analysis stored in between.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        with self.store.connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS expression_occurrences (
+                    norm TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    phrase TEXT NOT NULL,
+                    example TEXT,
+                    timestamp REAL,
+                    PRIMARY KEY (norm, video_id)
+                );
+                CREATE INDEX IF NOT EXISTS expression_occurrences_video ON expression_occurrences (video_id);
+
+                CREATE TABLE IF NOT EXISTS expression_indexed (
+                    video_id TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS expression_snapshot (
+                    norm TEXT NOT NULL,
+                    video_id TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS expression_snapshot_info (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    taken_at REAL NOT NULL
+                );
+            """)
+        self.snapshot_seconds = float(os.getenv('EXPRESSION_EXCLUDE_REFRESH_SECONDS', 86400))
+
+    def add_analysis(self, video_id):
+        """
+        Add (or refresh) the expressions of one stored analysis.
+
+        Returns:
+            True if the corpus was updated
+        """
+        stored = self.store.get(video_id)
+        if not stored:
+            return False
+
+        conn = self.store.connection()
+        row = conn.execute("SELECT etag FROM expression_indexed WHERE video_id = ?", (video_id,)).fetchone()
+        if row and row["etag"] == stored['etag']:
+            return False
+
+        occurrences = {}
+        for expr in stored['analysis'].get('english_expressions', []):
+            norm = normalize_phrase(expr.get('phrase'))
+            if norm and norm not in occurrences:
+                occurrences[norm] = (norm, video_id, expr.get('phrase', ''), expr.get('example'), expr.get('timestamp'))
+
+        with conn:
+            conn.execute("DELETE FROM expression_occurrences WHERE video_id = ?", (video_id,))
+            conn.executemany(
+                "INSERT INTO expression_occurrences (norm, video_id, phrase, example, timestamp) VALUES (?, ?, ?, ?, ?)",
+                occurrences.values()
+            )
+            conn.execute("INSERT OR REPLACE INTO expression_indexed (video_id, etag) VALUES (?, ?)",
+                         (video_id, stored['etag']))
+        return True
+
+    def sync(self):
+        """
+        Add every stored analysis that is missing or stale in the corpus.
+
+        Returns:
+            Number of analyses added
+        """
+        stale = self.store.connection().execute("""
+            SELECT a.video_id FROM analyses a
+            LEFT JOIN expression_indexed e ON e.video_id = a.video_id
+            WHERE e.etag IS NULL OR e.etag != a.etag
+        """).fetchall()
+        return sum(1 for row in stale if self.add_analysis(row["video_id"]))
+
+    def browse(self, query=None, limit=50, offset=0, examples=3):
+        """
+        List expressions by frequency (number of videos they appear in).
+
+        Args:
+            query: Optional substring filter on the normalized phrase
+            limit: Page size
+            offset: Page offset
+            examples: Example occurrences to include per expression
+
+        Returns:
+            List of dicts with phrase, norm, frequency and examples
+        """
+        sql = """
+            SELECT norm, COUNT(*) AS frequency,
+                   (SELECT phrase FROM expression_occurrences o2 WHERE o2.norm = o.norm
+                    GROUP BY phrase ORDER BY COUNT(*) DESC LIMIT 1) AS phrase
+            FROM expression_occurrences o
+        """
+        params = []
+        if query:
+            sql += " WHERE norm LIKE ?"
+            params.append(f"%{normalize_phrase(query)}%")
+        sql += " GROUP BY norm ORDER BY frequency DESC, norm LIMIT ? OFFSET ?"
+        params += [limit, offset]
+
+        conn = self.store.connection()
+        results = []
+        for row in conn.execute(sql, params).fetchall():
+            occurrences = conn.execute(
+                "SELECT video_id, example, timestamp FROM expression_occurrences WHERE norm = ? LIMIT ?",
+                (row["norm"], examples)
+            ).fetchall()
+            results.append({
+                "phrase": row["phrase"],
+                "norm": row["norm"],
+                "frequency": row["frequency"],
+                "examples": [
+                    {
+                        "video_id": o["video_id"],
+                        "example": o["example"],
+                        "timestamp": o["timestamp"],
+                        "timestamp_url": f"https://www.youtube.com/watch?v={o['video_id']}&t={int(o['timestamp'] or 0)}s",
+                    }
+                    for o in occurrences
+                ],
+            })
+        return results
+
+    def _refresh_snapshot(self):
+        """Re-take the known-phrases snapshot if it is older than snapshot_seconds."""
+        conn = self.store.connection()
+        row = conn.execute("SELECT taken_at FROM expression_snapshot_info WHERE id = 1").fetchone()
+        if row and row["taken_at"] > time.time() - self.snapshot_seconds:
+            return
+        with conn:
+            conn.execute("DELETE FROM expression_snapshot")
+            conn.execute("INSERT INTO expression_snapshot (norm, video_id) SELECT norm, video_id FROM expression_occurrences")
+            conn.execute("INSERT OR REPLACE INTO expression_snapshot_info (id, taken_at) VALUES (1, ?)", (time.time(),))
+
+    def known_phrases(self, limit=50, min_frequency=2, exclude_video_id=None):
+        """
+        The most common expressions in the current snapshot of the corpus,
+        used as exclusions when asking the model for new expressions.
+
+        Args:
+            limit: Maximum phrases to return
+            min_frequency: Minimum number of videos a phrase appears in
+            exclude_video_id: Video whose own occurrences are not counted
+                (the one being analyzed)
+
+        Returns:
+            List of phrase strings, most frequent first
+        """
+        self._refresh_snapshot()
+        rows = self.store.connection().execute("""
+            SELECT norm, COUNT(*) AS frequency FROM expression_snapshot
+            WHERE video_id != ?
+            GROUP BY norm HAVING frequency >= ?
+            ORDER BY frequency DESC, norm LIMIT ?
+        """, (exclude_video_id or '', min_frequency, limit)).fetchall()
+        return [row["norm"] for row in rows]
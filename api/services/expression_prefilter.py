@@ -0,0 +1,148 @@
+import os
+import re
+import math
+
+import numpy as np
+
+from services.youtube_service import YouTubeService
+
+# Idioms and framing phrases that mark executive / business English. A hit is
+# a strong signal that a window contains something worth teaching.
+PHRASE_LEXICON = [
+    "move the needle", "double click", "circle back", "low hanging fruit", "north star",
+    "table stakes", "boil the ocean", "first principles", "at the end of the day",
+    "bottom line", "deep dive", "in a nutshell", "take it offline", "on the same page",
+    "the elephant in the room", "moving forward", "going forward", "trade off", "tradeoff",
+    "zoom out", "zoom in", "level set", "push back", "buy in", "skin in the game",
+    "at scale", "bandwidth", "leverage", "alignment", "stakeholder", "hypothesis",
+    "the reality is", "the key insight", "what i would argue", "to be candid", "frankly",
+    "fundamentally", "counterintuitive", "the flip side", "by the same token",
+    "double down", "pivot", "raise the bar", "set the tone", "a forcing function",
+    "the long tail", "flywheel", "inflection point", "paradigm", "nuance", "orthogonal",
+    "net net", "in hindsight", "rule of thumb", "at the margin", "second order",
+    "make the case", "drive consensus", "disagree and commit", "get ahead of",
+]
+
+STOPWORDS = set("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers him his how i if in into is it its itself just like me
+more most my no nor not now of off on once only or other our ours out over own really right
+same she should so some such than that the their them then there these they this those
+through to too um uh under until up very was we were what when where which while who whom
+why will with you your yours yeah okay oh gonna kind sort thing things know think mean going
+get got go say said one two also well actually
+""".split())
+
+_TOKEN = re.compile(r"[a-z][a-z']+")
+
+
+def group_windows(transcript_data, window_seconds):
+    """Group caption segments into windows of roughly `window_seconds`."""
+    windows, current, start = [], [], None
+    for segment in transcript_data:
+        if start is None:
+            start = segment.get('start', 0)
+        current.append(segment)
+        if segment.get('start', 0) + segment.get('duration', 0) - start >= window_seconds:
+            windows.append(current)
+            current, start = [], None
+    if current:
+        windows.append(current)
+    return windows
+
+
+def score_windows(window_texts):
+    """
+    Score caption windows for likely advanced business English.
+
+    Combines lexicon hits with n-gram rarity: unigrams and bigrams are
+    weighted by inverse document frequency across the video's own windows
+    (ignoring stopwords), so topical words repeated all talk long score low
+    while unusual, once-off wording scores high.
+
+    Args:
+        window_texts: List of window text strings
+
+    Returns:
+        NumPy array of scores, one per window
+    """
+    texts = [t.lower().replace('-', ' ') for t in window_texts]
+    n = len(texts)
+
+    lexicon_hits = np.array(
+        [sum(text.count(phrase) for phrase in PHRASE_LEXICON) for text in texts], dtype=np.float64
+    )
+
+    # Sparse term-count matrix as (row, col) index pairs
+    vocab = {}
+    rows, cols = [], []
+    token_counts = np.zeros(n, dtype=np.float64)
+    for i, text in enumerate(texts):
+        tokens = [t for t in _TOKEN.findall(text) if t not in STOPWORDS]
+        token_counts[i] = len(tokens)
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for gram in grams:
+            rows.append(i)
+            cols.append(vocab.setdefault(gram, len(vocab)))
+
+    if not vocab:
+        return lexicon_hits
+
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    vocab_size = len(vocab)
+
+    # Document frequency from the distinct (window, term) pairs
+    distinct = np.unique(rows * vocab_size + cols)
+    document_frequency = np.bincount(distinct % vocab_size, minlength=vocab_size)
+    idf = np.log((1 + n) / (1 + document_frequency)) + 1
+
+    # Mean rarity of each window's terms
+    rarity = np.bincount(rows, weights=idf[cols], minlength=n) / np.maximum(np.bincount(rows, minlength=n), 1)
+
+    # Share of long (9+ letter) words, a cheap proxy for sophisticated vocabulary
+    is_long_word = np.array([' ' not in term and len(term) >= 9 for term in vocab], dtype=np.float64)
+    long_words = np.bincount(rows, weights=is_long_word[cols], minlength=n) / np.maximum(token_counts, 1)
+
+    def standardize(values):
+        spread = values.std()
+        return (values - values.mean()) / spread if spread > 0 else np.zeros_like(values)
+
+    return 2.0 * lexicon_hits + standardize(rarity) + 0.5 * standardize(long_words)
+
+
+def build_expression_candidates(transcript_data, ratio=None, min_windows=None, window_seconds=None):
+    """
+    Select the caption windows most likely to contain advanced expressions.
+
+    Only the top-scoring windows are kept, in chronological order, each line
+    keeping its real caption timestamp so the model's timestamps stay exact.
+
+    Args:
+        transcript_data: Caption segments ([{text, start, duration}])
+        ratio: Fraction of windows to keep (EXPRESSION_PREFILTER_RATIO, default 0.1)
+        min_windows: Lower bound on windows kept (EXPRESSION_PREFILTER_MIN_WINDOWS, default 12)
+        window_seconds: Window length (EXPRESSION_PREFILTER_WINDOW_SECONDS, default 20)
+
+    Returns:
+        Timestamped transcript excerpt text (the full transcript when short)
+    """
+    ratio = ratio if ratio is not None else float(os.getenv('EXPRESSION_PREFILTER_RATIO', 0.1))
+    min_windows = min_windows if min_windows is not None else int(os.getenv('EXPRESSION_PREFILTER_MIN_WINDOWS', 12))
+    window_seconds = window_seconds or float(os.getenv('EXPRESSION_PREFILTER_WINDOW_SECONDS', 20))
+
+    windows = group_windows(transcript_data, window_seconds)
+    keep = max(min_windows, math.ceil(len(windows) * ratio))
+
+    if len(windows) > keep:
+        scores = score_windows([' '.join(s.get('text', '') for s in window) for window in windows])
+        selected = sorted(np.argsort(-scores, kind='stable')[:keep])
+        windows = [windows[i] for i in selected]
+
+    lines = []
+    for window in windows:
+        for segment in window:
+            lines.append(f"{YouTubeService.format_timestamp(segment.get('start', 0))} {segment.get('text', '')}")
+        lines.append("...")
+    return "\n".join(lines[:-1])
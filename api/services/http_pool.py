@@ -0,0 +1,137 @@
+import os
+import threading
+from collections import Counter
+
+# Process-wide HTTP connection pools shared by every outbound client
+# (Gemini, Notion, OAuth token exchange). Reusing connections saves the
+# TCP + TLS handshake on every external call.
+#
+# httpx and requests are imported inside the getters so that importing this
+# module stays free at cold start.
+
+_lock = threading.Lock()
+_transport = None
+_session = None
+_request_counts = Counter()
+
+
+def _pool_settings():
+    return {
+        "max_connections": int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', 50)),
+        "max_keepalive": int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', 20)),
+        "keepalive_expiry": float(os.getenv('HTTP_POOL_KEEPALIVE_EXPIRY', 60)),
+        "http2": os.getenv('HTTP_POOL_HTTP2', '1') == '1',
+    }
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_httpx_transport():
+    """
+    Return the shared httpx transport (connection pool).
+
+    Each caller wraps it in its own httpx.Client so per-client state such as
+    auth headers stays separate while the underlying connections are pooled.
+    HTTP/2 is used when the `h2` package is installed.
+    """
+    global _transport
+    if _transport is None:
+        with _lock:
+            if _transport is None:
+                import httpx
+
+                class _CountingTransport(httpx.HTTPTransport):
+                    def handle_request(self, request):
+                        _request_counts[request.url.host] += 1
+                        return super().handle_request(request)
+
+                settings = _pool_settings()
+                _transport = _CountingTransport(
+                    http2=settings["http2"] and _http2_available(),
+                    limits=httpx.Limits(
+                        max_connections=settings["max_connections"],
+                        max_keepalive_connections=settings["max_keepalive"],
+                        keepalive_expiry=settings["keepalive_expiry"]
+                    )
+                )
+    return _transport
+
+
+def get_httpx_client(**kwargs):
+    """Return a new httpx.Client backed by the shared connection pool."""
+    import httpx
+    return httpx.Client(transport=get_httpx_transport(), **kwargs)
+
+
+def get_session():
+    """
+    Return the shared requests.Session used for plain REST calls (e.g. OAuth).
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                settings = _pool_settings()
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=10,
+                    pool_maxsize=settings["max_keepalive"]
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+
+                def count_response(response, *args, **kwargs):
+                    _request_counts[response.request.url.split('/')[2]] += 1
+
+                session.hooks["response"].append(count_response)
+                _session = session
+    return _session
+
+
+def pool_stats():
+    """
+    Snapshot of pool usage for the metrics endpoint.
+
+    Returns:
+        Dictionary with configured limits, open/idle connections and
+        request counts per host
+    """
+    stats = {
+        "settings": _pool_settings(),
+        "requests_by_host": dict(_request_counts),
+        "httpx": None,
+        "requests": None,
+    }
+
+    if _transport is not None:
+        # httpcore exposes its live connections on the pool object
+        connections = list(getattr(getattr(_transport, '_pool', None), 'connections', []))
+        stats["httpx"] = {
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "http2": any(getattr(c, '_connection', None).__class__.__name__ == 'HTTP2Connection'
+                         for c in connections),
+        }
+
+    if _session is not None:
+        pools = {}
+        for adapter in set(_session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                pools[pool.host] = {
+                    "connections_created": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle_connections": pool.pool.qsize() if pool.pool else 0,
+                }
+        stats["requests"] = pools
+
+    return stats
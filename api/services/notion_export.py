@@ -0,0 +1,122 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from services.notion_service import NotionService, notion_token_key
+
+
+def resolve_export_payload(store, analysis_id=None, analysis_data=None):
+    """
+    Resolve what to export: a stored analysis (with its cached Notion block
+    rendering) or a payload sent by the client. A payload sent along with an
+    analysis_id that this instance does not store (serverless stores are
+    per instance) is exported under that ID.
+
+    Returns:
+        Tuple of (analysis_data, blocks); blocks is None for client payloads
+
+    Raises:
+        LookupError: If analysis_id is not in the store and no payload was sent
+    """
+    if not analysis_id:
+        return analysis_data, None
+
+    stored = store.get(analysis_id)
+    if not stored:
+        if analysis_data:
+            return analysis_data, None
+        raise LookupError("No analysis found for this analysis_id")
+
+    # Reuse the rendered block list until the analysis changes
+    blocks = store.get_rendered_blocks(analysis_id, stored['etag'])
+    if blocks is None:
+        blocks = NotionService.render_blocks(stored['analysis'])
+        store.save_rendered_blocks(analysis_id, stored['etag'], blocks)
+    return stored['analysis'], blocks
+
+
+def export_analysis_job(store, access_token, analysis_id, analysis_data, blocks, report_progress=None):
+    """
+    Export one analysis to Notion, updating the page from a previous export
+    of the same analysis in the same workspace instead of creating another.
+
+    Returns:
+        Dict with notion_url, page_id and mode
+    """
+    service = NotionService(auth_token=access_token)
+    previous = store.get_notion_export(analysis_id, service.token_key) if analysis_id else None
+
+    if report_progress:
+        report_progress(0, 1, "Updating Notion page" if previous else "Creating Notion page")
+    export = service.export_analysis(analysis_data, blocks=blocks, previous=previous)
+    if analysis_id:
+        store.save_notion_export(analysis_id, service.token_key, export)
+    if report_progress:
+        report_progress(1, 1, f"Notion page {export['mode']}")
+
+    return {
+        "notion_url": export['url'],
+        "page_id": export['page_id'],
+        "mode": export['mode'],
+    }
+
+
+def export_job_key(access_token, analysis_id):
+    """Key that de-duplicates concurrent exports of one analysis to one workspace."""
+    if not analysis_id:
+        return None
+    return f"notion:{analysis_id}:{notion_token_key(access_token)}"
+
+
+def bulk_export_job(store, access_token, analysis_ids, database_id, report_progress=None):
+    """
+    Write many stored analyses as rows of a Notion database.
+
+    Rows are exported by a small pool of threads that all share the token's
+    rate limiter, so requests stay pipelined right at Notion's limit. Every
+    finished row is recorded, so re-running the job (e.g. after a crash or
+    timeout) skips rows that are already up to date and resumes the rest.
+
+    Returns:
+        Dict with database_id, per-mode counts and failed items
+    """
+    service = NotionService(auth_token=access_token)
+    # Row exports are tracked separately from standalone page exports
+    export_key = f"{service.token_key}:{database_id}"
+    counts = {"created": 0, "updated": 0, "replaced": 0, "unchanged": 0}
+    failed = []
+    done = 0
+    lock = threading.Lock()
+
+    def export_one(analysis_id):
+        nonlocal done
+        try:
+            analysis_data, blocks = resolve_export_payload(store, analysis_id)
+            previous = store.get_notion_export(analysis_id, export_key)
+            export = service.export_analysis(analysis_data, blocks=blocks, previous=previous,
+                                             database_id=database_id)
+            store.save_notion_export(analysis_id, export_key, export)
+            outcome = export['mode']
+        except Exception as e:
+            print(f"ERROR - Bulk export of {analysis_id} failed: {str(e)}")
+            outcome = None
+            error = str(e)
+
+        with lock:
+            done += 1
+            if outcome:
+                counts[outcome] += 1
+            else:
+                failed.append({"analysis_id": analysis_id, "error": error})
+            if report_progress:
+                report_progress(done, len(analysis_ids), f"Exported {analysis_id}")
+
+    concurrency = int(os.getenv('NOTION_BULK_CONCURRENCY', 3))
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='notion-bulk') as pool:
+        list(pool.map(export_one, analysis_ids))
+
+    return {
+        "database_id": database_id,
+        "counts": counts,
+        "failed": failed,
+    }
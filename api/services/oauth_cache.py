@@ -0,0 +1,96 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from services.http_pool import get_session
+
+GOOGLE_TOKENINFO_URI = "https://oauth2.googleapis.com/tokeninfo"
+
+
+def token_hash(token):
+    """Cache key for a token, so raw tokens are never kept as dictionary keys."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def fetch_tokeninfo(access_token):
+    """
+    Validate a Google access token with the tokeninfo endpoint.
+
+    Returns:
+        Token info dict (exp, sub, email, aud, scope) if the token is valid and,
+        when GOOGLE_CLIENT_ID is set, was issued to this app; else None
+    """
+    try:
+        response = get_session().get(GOOGLE_TOKENINFO_URI, params={"access_token": access_token}, timeout=10)
+    except Exception as e:
+        print(f"ERROR - Token validation failed: {str(e)}")
+        return None
+    if response.status_code != 200:
+        return None
+    info = response.json()
+    client_id = os.getenv('GOOGLE_CLIENT_ID')
+    if client_id and info.get('aud') != client_id:
+        return None
+    return info
+
+
+class TokenValidationCache:
+    """
+    Remembers validated OAuth access tokens until they expire, so requests
+    with a known token skip the validation round trip.
+
+    `validate(token)` returns the token info (as from tokeninfo) for a valid
+    token and None otherwise. A token is trusted until its `exp` (or
+    `expires_in`), and at most OAUTH_TOKEN_CACHE_SECONDS (300) when the info
+    carries no expiry. Invalid tokens are never cached.
+    """
+
+    def __init__(self, validate=fetch_tokeninfo, default_ttl=None, max_size=None):
+        self.validate = validate
+        self.default_ttl = default_ttl or float(os.getenv('OAUTH_TOKEN_CACHE_SECONDS', 300))
+        self.max_size = max_size or int(os.getenv('OAUTH_CACHE_SIZE', 1024))
+        self._entries = OrderedDict()  # token hash -> (cached until, token info)
+        self._lock = threading.Lock()
+
+    def lookup(self, token):
+        """
+        Validate a token, from the cache when possible.
+
+        Returns:
+            Token info dict if the token is valid, else None
+        """
+        key = token_hash(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+
+        info = self.validate(token)
+        if not info:
+            return None
+        if info.get('exp'):
+            expires_at = float(info['exp'])
+        elif info.get('expires_in'):
+            expires_at = now + float(info['expires_in'])
+        else:
+            expires_at = now + self.default_ttl
+        with self._lock:
+            self._entries[key] = (expires_at, info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return info
+
+    def is_valid(self, token):
+        return self.lookup(token) is not None
+
+    def user_id(self, token):
+        """Stable ID (Google `sub`, else email) of a valid token's user, or None."""
+        info = self.lookup(token)
+        return info and (info.get('sub') or info.get('email'))
@@ -0,0 +1,140 @@
+import os
+import re
+
+import numpy as np
+
+from services.expression_prefilter import STOPWORDS, group_windows
+from services.youtube_service import YouTubeService
+
+# Rough size of a token in English transcript text, used for budgeting
+CHARS_PER_TOKEN = 4
+
+# Sponsor reads, channel housekeeping and sign-offs that carry no insight
+NOISE_LEXICON = [
+    "sponsor", "sponsored", "promo code", "discount code", "use code", "link in the description",
+    "links in the description", "show notes", "subscribe", "hit the bell", "like and subscribe",
+    "leave a review", "five star review", "patreon", "brought to you by", "free trial",
+    "check them out", "welcome back to", "welcome to the show", "thanks for having me",
+    "thank you for having me", "thanks so much for coming", "where can people find you",
+    "see you next time", "thanks for listening", "thanks for watching",
+]
+
+_TOKEN = re.compile(r"[a-z][a-z']+")
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting (no model call)."""
+    return len(text or '') // CHARS_PER_TOKEN + 1
+
+
+def rank_windows(window_texts, damping=0.85, iterations=50):
+    """
+    Rank caption windows by how central they are to the talk.
+
+    Windows become L2-normalized TF-IDF vectors; TextRank runs on their
+    cosine-similarity graph, so windows that share vocabulary with many
+    others (the talk's substance) outrank one-off banter. Sponsor reads and
+    housekeeping phrases are then penalized.
+
+    Args:
+        window_texts: List of window text strings
+        damping: TextRank damping factor
+        iterations: Maximum power-iteration steps
+
+    Returns:
+        NumPy array of scores, one per window
+    """
+    texts = [t.lower().replace('-', ' ') for t in window_texts]
+    n = len(texts)
+    if n == 0:
+        return np.zeros(0)
+
+    vocab = {}
+    rows, cols = [], []
+    for i, text in enumerate(texts):
+        for token in _TOKEN.findall(text):
+            if token not in STOPWORDS:
+                rows.append(i)
+                cols.append(vocab.setdefault(token, len(vocab)))
+
+    noise_hits = np.array([sum(text.count(phrase) for phrase in NOISE_LEXICON) for text in texts],
+                          dtype=np.float64)
+    if not vocab:
+        return -noise_hits
+
+    term_frequency = np.zeros((n, len(vocab)), dtype=np.float64)
+    np.add.at(term_frequency, (np.asarray(rows), np.asarray(cols)), 1)
+    document_frequency = np.count_nonzero(term_frequency, axis=0)
+    vectors = np.log1p(term_frequency) * (np.log((1 + n) / (1 + document_frequency)) + 1)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    # Row-stochastic transition matrix; isolated windows jump uniformly
+    transition = np.where(out_weight > 0, similarity / np.maximum(out_weight, 1e-12), 1.0 / n)
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        updated = (1 - damping) / n + damping * (transition.T @ rank)
+        converged = np.abs(updated - rank).sum() < 1e-6
+        rank = updated
+        if converged:
+            break
+
+    # Scale to mean 1 so the noise penalty is comparable across talk lengths
+    return rank * n / (1 + noise_hits)
+
+
+def build_pm_digest(transcript_data, token_budget=None, window_seconds=None):
+    """
+    Build a token-budgeted extractive digest of a transcript for the PM
+    insights prompt.
+
+    The highest-ranked windows are taken until the budget is spent, then put
+    back in chronological order with their timestamps, "..." marking gaps.
+
+    Args:
+        transcript_data: Caption segments ([{text, start, duration}])
+        token_budget: Approximate token budget (PM_DIGEST_TOKEN_BUDGET, default 6000)
+        window_seconds: Window length (PM_DIGEST_WINDOW_SECONDS, default 30)
+
+    Returns:
+        Dict with text, tokens, full_tokens and the kept/total window counts
+    """
+    token_budget = token_budget or int(os.getenv('PM_DIGEST_TOKEN_BUDGET', 6000))
+    window_seconds = window_seconds or float(os.getenv('PM_DIGEST_WINDOW_SECONDS', 30))
+
+    windows = group_windows(transcript_data, window_seconds)
+    window_lines = [
+        [f"{YouTubeService.format_timestamp(s.get('start', 0))} {s.get('text', '')}" for s in window]
+        for window in windows
+    ]
+    costs = np.array([estimate_tokens("\n".join(lines)) for lines in window_lines])
+    full_tokens = int(costs.sum())
+
+    selected = range(len(windows))
+    if full_tokens > token_budget:
+        scores = rank_windows([' '.join(s.get('text', '') for s in window) for window in windows])
+        chosen, spent = [], 0
+        for i in np.argsort(-scores, kind='stable'):
+            if spent + costs[i] <= token_budget:
+                chosen.append(i)
+                spent += costs[i]
+        selected = sorted(chosen)
+
+    lines, previous = [], None
+    for i in selected:
+        if previous is not None and i != previous + 1:
+            lines.append("...")
+        lines.extend(window_lines[i])
+        previous = i
+
+    text = "\n".join(lines)
+    return {
+        "text": text,
+        "tokens": estimate_tokens(text),
+        "full_tokens": full_tokens,
+        "windows_kept": len(selected),
+        "windows_total": len(windows),
+    }
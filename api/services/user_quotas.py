@@ -0,0 +1,95 @@
+import os
+import time
+import hashlib
+
+
+def client_address(forwarded_for=None, remote_addr=None):
+    """
+    Address of the client as seen by our outermost trusted proxy.
+
+    X-Forwarded-For entries left of those our proxies appended are supplied
+    by the client, so only the TRUSTED_PROXY_HOPS (0) rightmost ones are
+    used: with one proxy (nginx, Vercel) the last entry is the client.
+    """
+    hops = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+    forwarded = [hop.strip() for hop in (forwarded_for or '').split(',') if hop.strip()]
+    if hops and forwarded:
+        return forwarded[-min(hops, len(forwarded))]
+    return remote_addr
+
+
+def user_key_for(user_id=None, forwarded_for=None, remote_addr=None):
+    """
+    Fair-share and quota key of a caller: a hash of its authenticated user ID
+    when there is one, else its client address.
+
+    Never derive user_id from anything the client can change at will (such as
+    an unvalidated bearer token or a rotating access token).
+    """
+    if user_id:
+        return "user:" + hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()[:16]
+    return f"addr:{client_address(forwarded_for, remote_addr) or 'unknown'}"
+
+
+class UserQuotas:
+    """
+    Daily per-user analysis quotas, tracked in the analysis database so all
+    processes share them.
+
+    Limits are USER_DAILY_REQUESTS analyses and USER_DAILY_TOKENS transcript
+    tokens per UTC day (0 = unlimited). Only analyses that reach Gemini are
+    counted; stored analyses are free.
+    """
+
+    def __init__(self, store, daily_requests=None, daily_tokens=None):
+        self.store = store
+        self.daily_requests = daily_requests if daily_requests is not None \
+            else int(os.getenv('USER_DAILY_REQUESTS', 0))
+        self.daily_tokens = daily_tokens if daily_tokens is not None else int(os.getenv('USER_DAILY_TOKENS', 0))
+        with self.store.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_usage (
+                    user_key TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    requests INTEGER NOT NULL DEFAULT 0,
+                    tokens INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_key, day)
+                )
+            """)
+
+    @staticmethod
+    def _day():
+        return time.strftime('%Y-%m-%d', time.gmtime())
+
+    def usage(self, user_key):
+        """Today's {"requests", "tokens"} for a user."""
+        row = self.store.connection().execute(
+            "SELECT requests, tokens FROM user_usage WHERE user_key = ? AND day = ?", (user_key, self._day())
+        ).fetchone()
+        return {"requests": row["requests"], "tokens": row["tokens"]} if row else {"requests": 0, "tokens": 0}
+
+    def exceeded(self, user_key):
+        """
+        Check a user's quota before admitting an analysis.
+
+        Returns:
+            Seconds until the quota resets (next UTC midnight) if it is used up, else None
+        """
+        if not self.daily_requests and not self.daily_tokens:
+            return None
+        usage = self.usage(user_key)
+        if (self.daily_requests and usage["requests"] >= self.daily_requests) or \
+                (self.daily_tokens and usage["tokens"] >= self.daily_tokens):
+            return int(86400 - time.time() % 86400) + 1
+        return None
+
+    def record(self, user_key, requests=0, tokens=0):
+        """Add to a user's usage for today."""
+        with self.store.connection() as conn:
+            conn.execute(
+                "INSERT INTO user_usage (user_key, day, requests, tokens, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_key, day) DO UPDATE SET requests = requests + excluded.requests, "
+                "tokens = tokens + excluded.tokens, updated_at = excluded.updated_at",
+                (user_key, self._day(), requests, tokens, time.time())
+            )
@@ -1,6 +1,6 @@
 import re
 import os
-from googleapiclient.discovery import build
+import threading
 
 try:
     from youtube_transcript_api import YouTubeTranscriptApi
@@ -14,6 +14,10 @@ try:
 except ImportError:
     HAS_YOUTUBE_TRANSCRIPT_API = False
 
+# googleapiclient resources wrap an httplib2.Http, which is not thread-safe,
+# so the built client is cached per thread and reused across requests.
+_thread_local = threading.local()
+
 
 class YouTubeService:
     """Service for extracting YouTube video data and transcripts. Uses youtube-transcript-api for
@@ -68,6 +72,31 @@ class YouTubeService:
         
         return None
     
+    @staticmethod
+    def parse_duration(duration):
+        """
+        Seconds in a YouTube Data API duration ("PT1H2M3S"), or None.
+        """
+        match = re.fullmatch(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?', duration or '')
+        if not match or not any(match.groups()):
+            return None
+        days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+        return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+    
+    @staticmethod
+    def _get_data_api_client(api_key):
+        """Return this thread's YouTube Data API client, building it on first use."""
+        client = getattr(_thread_local, 'youtube', None)
+        if client is None or getattr(_thread_local, 'api_key', None) != api_key:
+            # Deferred import: googleapiclient pulls in discovery/httplib2 and is
+            # only needed when an API key is configured.
+            from googleapiclient.discovery import build
+
+            client = build('youtube', 'v3', developerKey=api_key, cache_discovery=False)
+            _thread_local.youtube = client
+            _thread_local.api_key = api_key
+        return client
+
     @staticmethod
     def get_video_metadata(video_id):
         """
@@ -91,7 +120,7 @@ class YouTubeService:
                     "url": f"https://www.youtube.com/watch?v={video_id}"
                 }
             
-            youtube = build('youtube', 'v3', developerKey=api_key)
+            youtube = YouTubeService._get_data_api_client(api_key)
             
             response = youtube.videos().list(
                 part='snippet,contentDetails',
@@ -114,7 +143,8 @@ class YouTubeService:
                 "thumbnail": snippet.get('thumbnails', {}).get('maxres', {}).get('url', 
                     f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"),
                 "url": f"https://www.youtube.com/watch?v={video_id}",
-                "channel": snippet.get('channelTitle', 'Unknown')
+                "channel": snippet.get('channelTitle', 'Unknown'),
+                "duration_seconds": YouTubeService.parse_duration(video.get('contentDetails', {}).get('duration'))
             }
         except Exception as e:
             print(f"Error fetching metadata: {e}")
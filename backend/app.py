@@ -1,13 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-import requests
 import base64
 
 from services.youtube_service import YouTubeService
 from services.ai_service import AIService
 from services.notion_service import NotionService
+from services.http_pool import get_session, pool_stats
+from services.analysis_store import AnalysisStore
+from services.http_cache import cached_json_response
+from services.job_queue import JobQueue
+from services.admission import AdmissionController
+from services.user_quotas import UserQuotas, user_key_for
+from services.search_index import SearchIndex
+from services.expression_corpus import ExpressionCorpus
+from services.related_index import RelatedIndex
+from services.analysis_pipeline import AnalysisPipeline, STAGE_ERROR_LABELS
+from services.pipeline import StageError, pipeline_stats
+from services.profiles import get_profile
+from services.transcript_digest import estimate_tokens
+from services.model_router import latency_tracker
+from services.token_budget import token_budget
+from services.notion_export import resolve_export_payload, export_analysis_job, export_job_key, bulk_export_job
 
 # Load environment variables
 load_dotenv()
@@ -16,10 +31,25 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
+# Skip key sorting and pretty-printing when serializing responses
+app.json.sort_keys = False
+app.json.compact = True
+
 # Initialize services
 youtube_service = YouTubeService()
 ai_service = AIService()
 notion_service = NotionService()
+analysis_store = AnalysisStore()
+job_queue = JobQueue(analysis_store)
+admission = AdmissionController(analysis_store)
+user_quotas = UserQuotas(analysis_store)
+search_index = SearchIndex(analysis_store)
+search_index.sync()  # index analyses stored before the index existed
+expression_corpus = ExpressionCorpus(analysis_store)
+expression_corpus.sync()
+related_index = RelatedIndex(analysis_store)
+related_index.sync()
+analysis_pipeline = AnalysisPipeline(youtube_service, ai_service, expression_corpus, analysis_store)
 
 
 @app.route('/api/health', methods=['GET'])
@@ -28,6 +58,19 @@ def health_check():
     return jsonify({"status": "healthy", "message": "PM-ENG API is running"})
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Runtime metrics: connection pools, pipeline stages, model latency and tokens, admission, Vertex endpoints."""
+    return jsonify({
+        "http_pool": pool_stats(),
+        "pipeline": pipeline_stats(),
+        "model_latency": latency_tracker.stats(),
+        "tokens": token_budget.stats(),
+        "admission": admission.stats(),
+        "vertex_pool": ai_service.pool.stats()
+    })
+
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_video():
     """
@@ -35,7 +78,11 @@ def analyze_video():
     
     Expected JSON body:
     {
-        "youtube_url": "https://youtube.com/watch?v=..."
+        "youtube_url": "https://youtube.com/watch?v=...",
+        "refresh": false,    # optional, re-run even if a stored analysis exists;
+                             # a list of stage names re-runs only those stages
+        "synthesis": false,  # optional, stream a synthesis section after the analysis
+        "profile": "fast"    # optional latency profile: fast | balanced | thorough
     }
     
     Returns:
@@ -43,7 +90,8 @@ def analyze_video():
         "success": true,
         "video": {...},
         "pm_insights": [...],
-        "english_expressions": [...]
+        "english_expressions": [...],
+        "profile": {"name": "balanced", "model": "...", "seconds": 12.3}
     }
     """
     try:
@@ -67,51 +115,91 @@ def analyze_video():
         # Extract video ID
         video_id = youtube_service.extract_video_id(youtube_url)
         
-        # Get video metadata
-        video_metadata = youtube_service.get_video_metadata(video_id)
+        refresh = data.get('refresh')
+        refresh = refresh if isinstance(refresh, list) else bool(refresh)
         
-        # Get transcript
+        # Latency profile: per request, else the deployment default
         try:
-            transcript_result = youtube_service.get_transcript(video_id)
+            profile = get_profile(data.get('profile'))
         except ValueError as e:
             return jsonify({
                 "success": False,
                 "error": str(e)
             }), 400
         
-        # Analyze for PM insights
-        try:
-            pm_insights = ai_service.analyze_pm_insights(
-                transcript_text=transcript_result.get('full_text'),
-                video_title=None, # Could fetch from YouTube API if needed
-                video_url=youtube_url if transcript_result.get('fallback_needed') else None
-            )
-        except ValueError as e:
+        # With "synthesis": true the response is NDJSON: the analysis first,
+        # then the synthesis section once it is ready.
+        def respond(analysis):
+            if data.get('synthesis'):
+                return Response(
+                    stream_with_context(analysis_pipeline.stream_sections(analysis, profile, refresh=refresh)),
+                    mimetype='application/x-ndjson'
+                )
+            return jsonify(analysis)
+        
+        # Serve a previously stored analysis unless a refresh was requested
+        if not refresh:
+            stored = analysis_store.get(video_id)
+            # An explicitly requested profile is only served from a matching analysis
+            stored_profile = (stored['analysis'].get('profile') or {}).get('name') if stored else None
+            if stored and (not data.get('profile') or stored_profile == profile['name']):
+                return respond(stored['analysis'])
+        
+        # Per-user daily quotas only count analyses that reach Gemini
+        user_key = user_key_for(forwarded_for=request.headers.get('X-Forwarded-For'),
+                                remote_addr=request.remote_addr)
+        reset_in = user_quotas.exceeded(user_key)
+        if reset_in:
             return jsonify({
                 "success": False,
-                "error": f"PM insights analysis failed: {str(e)}"
-            }), 500
+                "error": "Daily analysis quota reached. Stored analyses remain available.",
+                "retry_after": reset_in
+            }), 429, {"Retry-After": str(reset_in)}
+        
+        # Bound concurrent analyses (stored analyses above never wait): a
+        # full queue is shed at once rather than slowing everyone down.
+        # Waiting requests are served round-robin across users.
+        ticket = admission.acquire(user_key)
+        if ticket is None:
+            retry_after = admission.retry_after()
+            return jsonify({
+                "success": False,
+                "error": "The server is busy analyzing other videos. Please retry shortly.",
+                "retry_after": retry_after
+            }), 503, {"Retry-After": str(retry_after)}
         
-        # Analyze for English expressions
+        # Run the analysis pipeline: metadata and transcript are fetched in
+        # parallel, then the PM and English analyses run in parallel.
+        # "refresh" may also name the stages to re-run (e.g. ["pm_insights"]);
+        # everything else is reused from the stage cache.
         try:
-            english_expressions = ai_service.analyze_english_expressions(
-                transcript_text=transcript_result.get('full_text'),
-                video_id=video_id,
-                video_url=youtube_url if transcript_result.get('fallback_needed') else None
+            result, transcript_result, _ = analysis_pipeline.run(
+                video_id,
+                profile,
+                refresh=refresh
             )
-        except ValueError as e:
+        except StageError as e:
+            if e.stage == 'captions':
+                return jsonify({
+                    "success": False,
+                    "error": str(e)
+                }), 400
+            label = STAGE_ERROR_LABELS.get(e.stage, f"Stage {e.stage}")
             return jsonify({
                 "success": False,
-                "error": f"English expression analysis failed: {str(e)}"
+                "error": f"{label} failed: {str(e)}"
             }), 500
+        finally:
+            admission.release(ticket)
+        
+        analysis_store.save(video_id, result, transcript=transcript_result.get('transcript'))
+        user_quotas.record(user_key, requests=1, tokens=estimate_tokens(transcript_result.get('full_text')))
+        search_index.index_analysis(video_id)
+        expression_corpus.add_analysis(video_id)
+        related_index.add_analysis(video_id)
         
         # Return successful response
-        return jsonify({
-            "success": True,
-            "video": video_metadata,
-            "pm_insights": pm_insights,
-            "english_expressions": english_expressions
-        })
+        return respond(result)
         
     except Exception as e:
         return jsonify({
@@ -120,6 +208,103 @@ def analyze_video():
         }), 500
 
 
+@app.route('/api/analysis/<video_id>', methods=['GET'])
+def get_analysis(video_id):
+    """
+    Return a stored analysis by YouTube video ID.
+    
+    Supports conditional requests (ETag / Last-Modified -> 304) and
+    brotli/gzip compression so browsers and CDNs can cache the result.
+    """
+    stored = analysis_store.get(video_id)
+    if not stored:
+        return jsonify({
+            "success": False,
+            "error": "No analysis found for this video"
+        }), 404
+    
+    return cached_json_response(
+        request,
+        stored['payload_json'],
+        etag=stored['etag'],
+        last_modified=stored['updated_at']
+    )
+
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """
+    Full-text search over stored transcripts, PM insights and expressions.
+    
+    Query params: q (required), limit (default 20, max 100), kind
+    (transcript | insight | expression). Never calls the LLM.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({
+            "success": False,
+            "error": "Query parameter q is required"
+        }), 400
+    
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    results = search_index.search(query, limit=limit, kind=request.args.get('kind'))
+    return jsonify({
+        "success": True,
+        "query": query,
+        "results": results
+    })
+
+
+@app.route('/api/related/<video_id>', methods=['GET'])
+def related_videos(video_id):
+    """
+    Previously analyzed videos most similar to this one (TF-IDF cosine over
+    transcripts and insights). Never calls the LLM.
+    
+    Query params: limit (default 10, max 50). For a video that has not been
+    analyzed yet (e.g. while its analysis is running), matches on its title.
+    """
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    results = related_index.related(video_id, limit=limit)
+    if results is None:
+        title = youtube_service.get_video_metadata(video_id).get('title')
+        results = related_index.related_to_text(title, limit=limit, exclude=video_id) if title else []
+    return jsonify({
+        "success": True,
+        "video_id": video_id,
+        "related": results
+    })
+
+
+@app.route('/api/expressions', methods=['GET'])
+def browse_expressions():
+    """
+    Browse the cross-video expression corpus, most frequent first.
+    
+    Query params: q (optional filter), limit (default 50, max 200), offset.
+    """
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    expressions = expression_corpus.browse(
+        query=request.args.get('q'),
+        limit=limit,
+        offset=max(0, request.args.get('offset', 0, type=int))
+    )
+    return jsonify({
+        "success": True,
+        "expressions": expressions
+    })
+
+
+@app.route('/api/expressions/known', methods=['GET'])
+def known_expressions():
+    """Expressions that are excluded from new analyses as already known."""
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    return jsonify({
+        "success": True,
+        "expressions": expression_corpus.known_phrases(limit=limit)
+    })
+
+
 @app.route('/api/notion/auth', methods=['POST'])
 def notion_auth():
     """
@@ -143,7 +328,7 @@ def notion_auth():
         credentials = f"{client_id}:{client_secret}"
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
 
-        response = requests.post(
+        response = get_session().post(
             "https://api.notion.com/v1/oauth/token",
             headers={
                 "Authorization": f"Basic {encoded_credentials}",
@@ -153,7 +338,8 @@ def notion_auth():
                 "grant_type": "authorization_code",
                 "code": code,
                 "redirect_uri": redirect_uri
-            }
+            },
+            timeout=30
         )
         
         token_data = response.json()
@@ -183,9 +369,23 @@ def notion_auth():
 def export_to_notion():
     """
     Export analysis data to a user's Notion page.
+    
+    Expected JSON body:
+    {
+        "access_token": "...",
+        "analysis_id": "VIDEO_ID",    # preferred: resolved from the analysis store
+        "analysis_data": {...},       # legacy: full analysis payload
+        "wait": false                 # optional, export synchronously
+    }
+    
+    By default the export runs as a background job and 202 is returned with
+    a job_id to poll at /api/jobs/<job_id>. Exporting an analysis that was
+    exported before updates the existing Notion page instead of creating
+    a new one.
     """
     try:
         data = request.get_json()
+        analysis_id = data.get('analysis_id')
         analysis_data = data.get('analysis_data')
         access_token = data.get('access_token')
         
@@ -195,33 +395,52 @@ def export_to_notion():
                 "error": "Notion access token is required"
             }), 401
             
+        try:
+            analysis_data, blocks = resolve_export_payload(analysis_store, analysis_id, analysis_data)
+        except LookupError as e:
+            # Distinct from Notion's 404s: the client may resend the payload
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "error_code": "analysis_not_found"
+            }), 404
+        
         if not analysis_data:
             return jsonify({
                 "success": False,
-                "error": "analysis_data is required"
+                "error": "analysis_id or analysis_data is required"
             }), 400
-            
-        # Initialize user-specific Notion client
-        user_notion_service = NotionService(auth_token=access_token)
         
-        # Determine parent page. For OAuth, users have shared specific pages.
-        # We will pick the first shared page we find.
-        pages = user_notion_service.search_pages()
-        if not pages:
+        def run_export(report_progress):
+            return export_analysis_job(analysis_store, access_token, analysis_id, analysis_data, blocks, report_progress)
+        
+        job_key = export_job_key(access_token, analysis_id)
+        params = {"analysis_id": analysis_id}
+        
+        if data.get('wait', False):
+            try:
+                job_id, result = job_queue.run_inline('notion_export', run_export, job_key=job_key, params=params)
+            except ValueError as e:
+                # No page shared with the integration
+                return jsonify({
+                    "success": False,
+                    "error": str(e)
+                }), 404
             return jsonify({
-                "success": False,
-                "error": "No accessible pages found in Notion. Please share a page with the integration."
-            }), 404
-            
-        parent_page_id = pages[0]['id']
-            
-        # Create Notion page
-        result = user_notion_service.create_analysis_page(parent_page_id, analysis_data)
+                "success": True,
+                "job_id": job_id,
+                "notion_url": result['notion_url'],
+                "mode": result['mode']
+            })
         
+        # Re-exports of the same analysis attach to the job already in flight
+        job_id = job_queue.submit('notion_export', run_export, job_key=job_key, params=params)
         return jsonify({
             "success": True,
-            "notion_url": result.get('url')
-        })
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202
         
     except Exception as e:
         print(f"Notion export error: {str(e)}")
@@ -231,6 +450,99 @@ def export_to_notion():
         }), 500
 
 
+@app.route('/api/export/notion/bulk', methods=['POST'])
+def bulk_export_to_notion():
+    """
+    Export many stored analyses as rows of a Notion database in one job.
+    
+    Expected JSON body:
+    {
+        "access_token": "...",
+        "analysis_ids": ["VIDEO_ID", ...],
+        "database_id": "...",         # optional, created under the parent page if omitted
+        "resume_job_id": "...",       # optional, re-run an earlier bulk job
+        "wait": false                 # optional, run synchronously
+    }
+    
+    Returns 202 with a job_id; progress is reported at /api/jobs/<job_id>.
+    Rows that are already up to date are skipped, so resuming is cheap.
+    """
+    try:
+        data = request.get_json()
+        access_token = data.get('access_token')
+        
+        if not access_token:
+            return jsonify({
+                "success": False,
+                "error": "Notion access token is required"
+            }), 401
+        
+        if data.get('resume_job_id'):
+            previous_job = job_queue.get(data['resume_job_id'])
+            if not previous_job or previous_job['kind'] != 'notion_bulk_export':
+                return jsonify({
+                    "success": False,
+                    "error": "Bulk export job not found"
+                }), 404
+            analysis_ids = previous_job['params']['analysis_ids']
+            database_id = previous_job['params']['database_id']
+        else:
+            analysis_ids = data.get('analysis_ids') or []
+            database_id = data.get('database_id')
+        
+        if not analysis_ids:
+            return jsonify({
+                "success": False,
+                "error": "analysis_ids is required"
+            }), 400
+        
+        if not database_id:
+            user_notion_service = NotionService(auth_token=access_token)
+            parent_page_id = user_notion_service.find_parent_page()
+            if not parent_page_id:
+                return jsonify({
+                    "success": False,
+                    "error": "No accessible pages found in Notion. Please share a page with the integration."
+                }), 404
+            database_id = user_notion_service.create_analysis_database(parent_page_id)['id']
+        
+        def run_bulk_export(report_progress):
+            return bulk_export_job(analysis_store, access_token, analysis_ids, database_id, report_progress)
+        
+        params = {"analysis_ids": analysis_ids, "database_id": database_id}
+        job_key = f"notion-bulk:{database_id}"
+        
+        if data.get('wait', False):
+            job_id, result = job_queue.run_inline('notion_bulk_export', run_bulk_export, job_key=job_key, params=params)
+            return jsonify(dict(result, success=True, job_id=job_id))
+        
+        job_id = job_queue.submit('notion_bulk_export', run_bulk_export, job_key=job_key, params=params)
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "database_id": database_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Failed to start bulk export: {str(e)}"
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and result of a background job."""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({
+            "success": False,
+            "error": "Job not found"
+        }), 404
+    return jsonify(dict(job, success=True))
+
 
 if __name__ == '__main__':
     # Check if API key is set
@@ -238,6 +550,9 @@ if __name__ == '__main__':
         print("WARNING: GOOGLE_API_KEY not found in environment variables")
         print("Please create a .env file with your API key")
     
-    print("Starting PM-ENG API server...")
+    # Development server only. In production run:
+    #   gunicorn -c gunicorn.conf.py app:app
+    debug = os.getenv('FLASK_DEBUG', '0') == '1'
+    print("Starting PM-ENG API server (development mode)...")
     print("API will be available at http://localhost:5001")
-    app.run(debug=True, port=5001)
+    app.run(debug=debug, port=5001, threaded=True)
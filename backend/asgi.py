@@ -0,0 +1,14 @@
+"""
+ASGI entry point for running the Flask app under uvicorn workers.
+
+    PMENG_WORKER_CLASS=async gunicorn -c gunicorn.conf.py asgi:asgi_app
+"""
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    raise ImportError("asgiref package not installed. Run: pip install uvicorn asgiref")
+
+from app import app
+
+asgi_app = WsgiToAsgi(app)
@@ -0,0 +1,72 @@
+"""
+Gunicorn configuration for running the PM-ENG backend in production.
+
+Usage (from the backend/ directory):
+    gunicorn -c gunicorn.conf.py app:app                      # threads (default)
+    PMENG_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py app:app
+    PMENG_WORKER_CLASS=async gunicorn -c gunicorn.conf.py asgi:asgi_app
+
+Every setting can be overridden through the environment variables below.
+"""
+
+import multiprocessing
+import os
+
+# Worker model:
+#   threads - gthread workers; each process serves PMENG_THREADS requests at once.
+#             Good default: requests spend almost all their time waiting on Gemini.
+#   gevent  - greenlet workers; thousands of concurrent slow requests per process.
+#             Requires `pip install gevent`.
+#   async   - uvicorn workers serving asgi.py. Requires `pip install uvicorn asgiref`.
+worker_mode = os.getenv('PMENG_WORKER_CLASS', 'threads')
+
+WORKER_CLASSES = {
+    'threads': 'gthread',
+    'gevent': 'gevent',
+    'async': 'uvicorn.workers.UvicornWorker',
+}
+if worker_mode not in WORKER_CLASSES:
+    raise ValueError(f"PMENG_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}, got '{worker_mode}'")
+
+if worker_mode == 'gevent':
+    # Patch before the app is loaded so the SDKs' sockets are cooperative
+    from gevent import monkey
+    monkey.patch_all()
+
+worker_class = WORKER_CLASSES[worker_mode]
+
+bind = os.getenv('PMENG_BIND', f"0.0.0.0:{os.getenv('PORT', '5001')}")
+
+# Analysis is I/O bound, so a couple of processes per core is plenty;
+# concurrency comes from threads / greenlets inside each process.
+workers = int(os.getenv('PMENG_WORKERS', min(multiprocessing.cpu_count() * 2, 8)))
+threads = int(os.getenv('PMENG_THREADS', 8))
+worker_connections = int(os.getenv('PMENG_WORKER_CONNECTIONS', 200))
+
+# Gemini calls on long transcripts routinely take 30-60s (two of them per
+# /api/analyze), so the hard timeout has to sit well above that.
+timeout = int(os.getenv('PMENG_TIMEOUT', 180))
+graceful_timeout = int(os.getenv('PMENG_GRACEFUL_TIMEOUT', 120))
+keepalive = int(os.getenv('PMENG_KEEPALIVE', 75))
+
+# Each worker imports app.py itself. Importing it opens SQLite connections,
+# syncs the search index and builds the HTTP connection pool and Gemini
+# clients, none of which may be shared across a fork; only enable preloading
+# (load once in the master) for an app that defers all of that.
+preload_app = os.getenv('PMENG_PRELOAD', '0') == '1'
+
+# Recycle workers periodically to bound memory growth from SDK caches
+max_requests = int(os.getenv('PMENG_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('PMENG_MAX_REQUESTS_JITTER', 100))
+
+reload = False
+accesslog = os.getenv('PMENG_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('PMENG_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    server.log.info(
+        f"PM-ENG backend: {worker_mode} workers={workers} threads={threads} "
+        f"timeout={timeout}s keepalive={keepalive}s preload={preload_app}"
+    )
@@ -11,6 +11,11 @@ sys.path.insert(0, os.path.dirname(__file__))
 from services.youtube_service import YouTubeService
 from services.ai_service import AIService
 from services.auth_service import AuthService
+from services.analysis_store import AnalysisStore
+from services.admission import AdmissionController
+from services.user_quotas import UserQuotas, user_key_for
+from services.transcript_digest import estimate_tokens
+from services.oauth_cache import TokenValidationCache
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -20,6 +25,12 @@ CORS(app, supports_credentials=True)  # Enable CORS with credentials
 # Initialize services
 ai_service = AIService()
 auth_service = AuthService()
+analysis_store = AnalysisStore()
+admission = AdmissionController(analysis_store)
+user_quotas = UserQuotas(analysis_store)
+youtube_service = YouTubeService()
+# Validated tokens (with their expiry and user) are reused across requests
+token_cache = TokenValidationCache()
 
 
 @app.route('/api/health', methods=['GET'])
@@ -190,39 +201,14 @@ def analyze_video():
         
         access_token = auth_header.split(' ')[1]
         
-        # Get refresh_token and scopes from request body (sent by frontend)
-        refresh_token = data.get('refresh_token')
-        scopes_str = data.get('scopes', '')
-        scopes = scopes_str.split(' ') if scopes_str else [
-            'https://www.googleapis.com/auth/youtube.force-ssl',
-            'https://www.googleapis.com/auth/userinfo.email',
-            'https://www.googleapis.com/auth/userinfo.profile'
-        ]
-        
-        # Validate token
-        if not auth_service.validate_token(access_token):
+        # Validate token (a cached lookup once the token has been seen)
+        if not token_cache.is_valid(access_token):
             return jsonify({
                 "success": False,
                 "error": "Invalid or expired token. Please sign in again.",
                 "auth_required": True
             }), 401
         
-        # Initialize YouTube service with user credentials
-        # Construct proper OAuth credentials with ALL required fields
-        from google.oauth2.credentials import Credentials
-        
-        credentials = Credentials(
-            token=access_token,
-            refresh_token=refresh_token,  # Add refresh_token
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv('GOOGLE_CLIENT_ID'),
-            client_secret=os.getenv('GOOGLE_CLIENT_SECRET'),
-            scopes=scopes  # Add scopes
-        )
-        
-        youtube_service = YouTubeService(credentials)
-        print(f"YouTubeService initialized with credentials")
-        
         # Validate YouTube URL
         if not youtube_service.validate_url(youtube_url):
             return jsonify({
@@ -255,29 +241,54 @@ def analyze_video():
                 "error": f"Failed to fetch transcript: {str(e)}"
             }), 500
         
-        # Analyze for PM insights
-        try:
-            pm_insights = ai_service.analyze_pm_insights(
-                transcript_result['full_text'],
-                video_title=video_metadata.get('title')
-            )
-        except ValueError as e:
+        # Gemini capacity is shared fairly: per-user daily quotas, and waiting
+        # requests are admitted round-robin across users
+        user_key = user_key_for(token_cache.user_id(access_token), request.headers.get('X-Forwarded-For'),
+                                request.remote_addr)
+        reset_in = user_quotas.exceeded(user_key)
+        if reset_in:
             return jsonify({
                 "success": False,
-                "error": f"PM insights analysis failed: {str(e)}"
-            }), 500
+                "error": "Daily analysis quota reached.",
+                "retry_after": reset_in
+            }), 429, {"Retry-After": str(reset_in)}
         
-        # Analyze for English expressions
-        try:
-            english_expressions = ai_service.analyze_english_expressions(
-                transcript_result['transcript'],
-                video_id
-            )
-        except ValueError as e:
+        ticket = admission.acquire(user_key)
+        if ticket is None:
+            retry_after = admission.retry_after()
             return jsonify({
                 "success": False,
-                "error": f"English expression analysis failed: {str(e)}"
-            }), 500
+                "error": "The server is busy analyzing other videos. Please retry shortly.",
+                "retry_after": retry_after
+            }), 503, {"Retry-After": str(retry_after)}
+        
+        try:
+            # Analyze for PM insights
+            try:
+                pm_insights = ai_service.analyze_pm_insights(
+                    transcript_result['full_text'],
+                    video_title=video_metadata.get('title')
+                )
+            except ValueError as e:
+                return jsonify({
+                    "success": False,
+                    "error": f"PM insights analysis failed: {str(e)}"
+                }), 500
+            
+            # Analyze for English expressions
+            try:
+                english_expressions = ai_service.analyze_english_expressions(
+                    transcript_result['transcript'],
+                    video_id
+                )
+            except ValueError as e:
+                return jsonify({
+                    "success": False,
+                    "error": f"English expression analysis failed: {str(e)}"
+                }), 500
+        finally:
+            admission.release(ticket)
+        user_quotas.record(user_key, requests=1, tokens=estimate_tokens(transcript_result.get('full_text')))
         
         # Return successful response
         return jsonify({
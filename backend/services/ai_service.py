@@ -1,28 +1,101 @@
 import os
 import json
 import re
-from google import genai
-from google.genai import types
+import time
+
+from services.http_pool import get_httpx_transport
+from services.profiles import get_profile, generation_config, transcription_profile
+from services.model_router import ModelRouter, latency_tracker
+from services.vertex_pool import VertexClientPool
+from services.token_budget import token_budget
 
 class AIService:
     """Service for AI-powered analysis using Google Gemini via the new google-genai SDK."""
     
     def __init__(self):
-        """Initialize Google Gemini client using Vertex AI to support native YouTube URIs."""
-        # Using vertexai allows Part.from_uri to fetch YouTube contents directly
-        project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
-        location = os.getenv('GOOGLE_CLOUD_LOCATION', 'us-central1')
-        
-        if not project_id:
-             print("WARNING: GOOGLE_CLOUD_PROJECT not found. Falling back to simple API key (native video URL parsing will fail).")
-             api_key = os.getenv('GOOGLE_API_KEY')
-             if not api_key:
-                 raise ValueError("Neither GOOGLE_CLOUD_PROJECT nor GOOGLE_API_KEY found in environment variables")
-             self.client = genai.Client(api_key=api_key)
-        else:
-             self.client = genai.Client(vertexai=True, project=project_id, location=location)
+        """Initialize Google Gemini clients using Vertex AI to support native YouTube URIs."""
+        # Route Gemini traffic through the shared keep-alive connection pool
+        http_options = {"client_args": {"transport": get_httpx_transport()}}
+
+        # Using vertexai allows Part.from_uri to fetch YouTube contents directly.
+        # Calls are spread over every configured project/location (VERTEX_ENDPOINTS).
+        # google.genai is imported inside from_env rather than at module load:
+        # it is the heaviest import in the app and only needed once an analysis runs.
+        self.pool = VertexClientPool.from_env(http_options)
              
-        self.model_id = 'gemini-2.5-flash'  # Unified fast and capable model
+        # Model of the deployment's latency profile; each call can pass its own profile
+        self.model_id = get_profile()['model']
+        self.router = ModelRouter()
+    
+    def route_profile(self, profile, transcript_tokens):
+        """
+        Resolve the "auto" profile for one request from the transcript size
+        and live per-model p95 latency. Other profiles are returned as is.
+        
+        Args:
+            profile: Profile dict (see services.profiles)
+            transcript_tokens: Estimated transcript tokens (0 if there is none)
+            
+        Returns:
+            Tuple of (profile, route dict or None)
+        """
+        if profile.get('name') != 'auto':
+            return profile, None
+        return self.router.route(transcript_tokens)
+    
+    def _generate(self, profile, contents, routed=False):
+        """
+        generate_content with the profile's model and limits on a pooled
+        client.
+        
+        Only the text analyses the router chooses a model for (routed=True)
+        feed its latency window; transcriptions, direct-video calls and
+        synthesis take far longer on a healthy model and would make it look
+        slow.
+        
+        Text prompts over the profile's max_input_tokens are compacted, then
+        truncated, before they are sent. Estimated vs actual prompt tokens
+        are recorded and calibrate later estimates.
+        """
+        model = profile['model']
+        text_only = all(isinstance(part, str) for part in contents)
+        estimated = token_budget.estimate_contents(contents, model)
+        shrunk = None
+        counted = None
+        budget = profile.get('max_input_tokens')
+        if budget and estimated > budget:
+            if text_only and os.getenv('TOKEN_COUNT_CALIBRATION') == '1':
+                # Near-budget estimates can be off either way; ask the model for the exact count
+                counted = self.pool.call(
+                    lambda client: client.models.count_tokens(model=model, contents=contents)
+                ).total_tokens
+                # The exact count decides this prompt; calibration only improves later estimates
+                token_budget.calibrate(model, sum(len(part) for part in contents), counted)
+                estimated = counted
+            if estimated > budget:
+                contents, shrunk = token_budget.fit_contents(contents, budget, model, total_tokens=counted)
+                print(f"DEBUG - Prompt of ~{estimated} tokens over the {budget} token budget of {model}: {shrunk}")
+                estimated = token_budget.estimate_contents(contents, model)
+        
+        started = time.perf_counter()
+        try:
+            response = self.pool.call(lambda client: client.models.generate_content(
+                model=model,
+                contents=contents,
+                config=generation_config(profile)
+            ), model=model)
+        finally:
+            if routed and text_only:
+                latency_tracker.record(model, time.perf_counter() - started)
+        
+        if text_only:
+            usage = getattr(response, 'usage_metadata', None)
+            actual = getattr(usage, 'prompt_token_count', None)
+            token_budget.calibrate(model, sum(len(part) for part in contents), actual)
+            finish_reason = response.candidates[0].finish_reason if getattr(response, 'candidates', None) else None
+            token_budget.record(model, estimated, actual, shrunk=shrunk,
+                                output_truncated='MAX_TOKENS' in str(finish_reason))
+        return response
     
     @staticmethod
     def sanitize_json_response(content):
@@ -100,7 +173,7 @@ class AIService:
         print(f"ERROR - Content: {error_context}")
         raise ValueError(f"Failed to parse AI response as JSON after {len(strategies)} attempts: {str(last_error)}")
     
-    def analyze_pm_insights(self, transcript_text=None, video_title=None, video_url=None):
+    def analyze_pm_insights(self, transcript_text=None, video_title=None, video_url=None, profile=None):
         """
         Analyze transcript or video for PM insights.
         
@@ -108,6 +181,7 @@ class AIService:
             transcript_text: Full transcript text (optional if video_url provided)
             video_title: Optional video title for context
             video_url: YouTube URL to analyze natively (fallback)
+            profile: Latency profile dict (see services.profiles); deployment default if None
             
         Returns:
             List of PM insights (max 5 points)
@@ -143,21 +217,14 @@ Return exactly 5 insights. Ensure the JSON is valid and properly formatted."""
             if transcript_text:
                 contents.append(f"Transcript:\n{transcript_text}")
             elif video_url:
+                from google.genai import types
                 contents.append(types.Part.from_uri(file_uri=video_url, mime_type="video/mp4"))
             else:
                  raise ValueError("Neither transcript_text nor video_url was provided.")
             
             contents.append(prompt)
             
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=contents,
-                config={
-                    "temperature": 0.7,
-                    "max_output_tokens": 8192,
-                    "response_mime_type": "application/json"
-                }
-            )
+            response = self._generate(profile or get_profile(), contents, routed=True)
             
             # Extract and sanitize JSON from response
             content = response.text
@@ -191,7 +258,8 @@ Return exactly 5 insights. Ensure the JSON is valid and properly formatted."""
             print(f"ERROR - PM Insights general error: {str(e)}")
             raise ValueError(f"AI analysis failed: {str(e)}")
     
-    def analyze_english_expressions(self, transcript_text=None, video_id=None, video_url=None):
+    def analyze_english_expressions(self, transcript_text=None, video_id=None, video_url=None, exclude_phrases=None,
+                                    profile=None):
         """
         Analyze transcript or video for advanced English expressions.
         
@@ -199,10 +267,21 @@ Return exactly 5 insights. Ensure the JSON is valid and properly formatted."""
             transcript_text: Timestamped transcript text (optional if video_url provided)
             video_id: YouTube video ID for timestamp URLs
             video_url: YouTube URL to analyze natively (fallback)
+            exclude_phrases: Optional already-known expressions (normalized) to skip
+            profile: Latency profile dict (see services.profiles); deployment default if None
             
         Returns:
             List of English expressions (max 7)
         """
+        count_instruction = "Return exactly 7 expressions."
+        exclusions = ""
+        if exclude_phrases:
+            # Known phrases are skipped, so fewer (novel) items may come back
+            count_instruction = "Return up to 7 expressions; fewer is fine if not enough new ones qualify."
+            exclusions = (
+                "\n\nThe learner already knows these expressions. Do NOT return them or close variants:\n"
+                + "; ".join(exclude_phrases)
+            )
         
         prompt = f"""Analyze this YouTube video and identify advanced English expressions suitable for business and professional settings.
 
@@ -230,7 +309,7 @@ Return ONLY a JSON array with this exact structure:
   }}
 ]
 
-Return exactly 7 expressions. Ensure the JSON is valid and properly formatted."""
+{count_instruction} Ensure the JSON is valid and properly formatted.{exclusions}"""
 
         try:
             contents = []
@@ -238,21 +317,14 @@ Return exactly 7 expressions. Ensure the JSON is valid and properly formatted.""
                 contents.append(f"Transcript (with timestamps):\n{transcript_text}")
 
             elif video_url:
+                from google.genai import types
                 contents.append(types.Part.from_uri(file_uri=video_url, mime_type="video/mp4"))
             else:
                  raise ValueError("Neither transcript_data nor video_url was provided.")
             
             contents.append(prompt)
 
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=contents,
-                config={
-                    "temperature": 0.7,
-                    "max_output_tokens": 8192,
-                    "response_mime_type": "application/json"
-                }
-            )
+            response = self._generate(profile or get_profile(), contents, routed=True)
             
             # Extract and sanitize JSON from response
             content = response.text
@@ -267,6 +339,12 @@ Return exactly 7 expressions. Ensure the JSON is valid and properly formatted.""
             # Parse JSON response with retry logic
             expressions = self.parse_json_with_retry(content, "English Expressions")
             
+            # Drop anything the model returned despite the exclusion list
+            if exclude_phrases:
+                from services.expression_corpus import normalize_phrase
+                known = set(exclude_phrases)
+                expressions = [e for e in expressions if normalize_phrase(e.get('phrase')) not in known]
+            
             # Add timestamp URLs
             for expr in expressions:
                 timestamp = expr.get('timestamp', 0)
@@ -290,3 +368,152 @@ Return exactly 7 expressions. Ensure the JSON is valid and properly formatted.""
         except Exception as e:
             print(f"ERROR - English Expressions general error: {str(e)}")
             raise ValueError(f"AI analysis failed: {str(e)}")
+    
+    def transcribe_video(self, video_url, start_seconds=None, end_seconds=None):
+        """
+        Timestamped transcript of (a clip of) a video without captions,
+        generated by Gemini from the video itself. Called once per video so
+        that both analyses can use the text path; frames are sampled at low
+        resolution and VIDEO_FALLBACK_FPS (default 0.2) since the speech is
+        what matters.
+        
+        Args:
+            video_url: YouTube URL to transcribe natively
+            start_seconds: Optional clip start offset
+            end_seconds: Optional clip end offset
+            
+        Returns:
+            List of {"text", "start", "duration"} segments, like captions
+            (empty if the clip has no speech)
+            
+        Raises:
+            ValueError: If the call fails, its JSON is invalid or the
+                transcript was cut off at the output token limit
+        """
+        from google.genai import types
+        
+        clip = {}
+        if start_seconds:
+            clip["start_offset"] = f"{int(start_seconds)}s"
+        if end_seconds:
+            clip["end_offset"] = f"{int(end_seconds)}s"
+        video = types.Part(
+            file_data=types.FileData(file_uri=video_url, mime_type="video/mp4"),
+            video_metadata=types.VideoMetadata(fps=float(os.getenv('VIDEO_FALLBACK_FPS', 0.2)), **clip)
+        )
+        
+        prompt = f"""Transcribe the speech in this video verbatim.
+
+Split the transcript into segments of one or two sentences (roughly 5-15 seconds each).
+For each segment give its start time in seconds from the beginning of the full video{f' (the clip starts at {int(start_seconds)} seconds)' if start_seconds else ''}.
+
+Return ONLY a JSON array with this exact structure:
+[
+  {{"start": 12.5, "text": "Spoken words of the segment"}}
+]
+
+Do not summarize or skip speech. Ensure the JSON is valid and properly formatted."""
+
+        try:
+            response = self._generate(transcription_profile(), [video, prompt])
+            finish_reason = response.candidates[0].finish_reason if getattr(response, 'candidates', None) else None
+            if 'MAX_TOKENS' in str(finish_reason):
+                raise ValueError("Video transcript was cut off at the output token limit")
+            
+            content = self.sanitize_json_response(response.text)
+            print(f"DEBUG - Video transcript sanitized JSON: {content[:500]}...")
+            
+            items = self.parse_json_with_retry(content, "Video transcript")
+            items = sorted(
+                ({"start": max(float(i.get('start') or 0), float(start_seconds or 0)),
+                  "text": (i.get('text') or '').strip()} for i in items if isinstance(i, dict)),
+                key=lambda i: i['start']
+            )
+            segments = []
+            for index, item in enumerate(items):
+                if not item['text']:
+                    continue
+                end = items[index + 1]['start'] if index + 1 < len(items) else (end_seconds or item['start'])
+                segments.append({"text": item['text'], "start": item['start'],
+                                 "duration": round(max(0.0, end - item['start']), 2)})
+            return segments
+            
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"ERROR - Video transcript general error: {str(e)}")
+            raise ValueError(f"Video transcription failed: {str(e)}")
+    
+    def synthesize_analysis(self, video_metadata=None, pm_insights=None, english_expressions=None, profile=None):
+        """
+        Synthesis (Agent 4): connect the PM insights and English expressions
+        into a summary, action items and a learning path.
+        
+        Works only from the structured outputs of the two analyses plus video
+        metadata - a few hundred tokens - and never resends the transcript.
+        
+        Args:
+            video_metadata: Video metadata dict (title, channel)
+            pm_insights: Output of analyze_pm_insights
+            english_expressions: Output of analyze_english_expressions
+            profile: Latency profile dict (see services.profiles); deployment default if None
+            
+        Returns:
+            Dict with executive_summary, key_themes, connections,
+            action_items and learning_path
+        """
+        video_metadata = video_metadata or {}
+        compact = {
+            "video": {k: video_metadata.get(k) for k in ('title', 'channel') if video_metadata.get(k)},
+            "pm_insights": [
+                {"title": i.get('title'), "description": i.get('description')} for i in pm_insights or []
+            ],
+            # Examples are trimmed; the phrase carries most of the meaning
+            "english_expressions": [
+                {"phrase": e.get('phrase'), "example": (e.get('example') or '')[:160]}
+                for e in english_expressions or []
+            ],
+        }
+        
+        prompt = f"""You are given the structured results of analyzing a YouTube video for Product Managers: its key PM insights and the advanced English expressions used in it.
+
+{json.dumps(compact, separators=(',', ':'), ensure_ascii=False)}
+
+Synthesize them for a PM who wants to grow their career and their business English:
+1. Write a 2-3 sentence executive summary of the video's value
+2. Name 3-5 key themes
+3. Connect PM insights to expressions that would help communicate them (2-4 connections)
+4. Create 3-5 prioritized action items, each tied to an insight or expression
+5. Suggest a short learning path (immediate, short term, long term)
+
+Return ONLY a JSON object with this exact structure:
+{{
+  "executive_summary": "...",
+  "key_themes": ["..."],
+  "connections": [
+    {{"pm_insight": "insight title", "related_expression": "phrase", "connection": "one sentence"}}
+  ],
+  "action_items": [
+    {{"priority": "high|medium|low", "action": "...", "related_insight": "insight title or null", "related_expression": "phrase or null"}}
+  ],
+  "learning_path": {{"immediate": ["..."], "short_term": ["..."], "long_term": ["..."]}}
+}}
+
+Use only the insights and expressions above. Ensure the JSON is valid and properly formatted."""
+
+        try:
+            response = self._generate(profile or get_profile(), [prompt])
+            
+            content = self.sanitize_json_response(response.text)
+            print(f"DEBUG - Synthesis sanitized JSON: {content[:500]}...")
+            
+            synthesis = self.parse_json_with_retry(content, "Synthesis")
+            if not isinstance(synthesis, dict):
+                raise ValueError("Synthesis response is not a JSON object")
+            return synthesis
+            
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"ERROR - Synthesis general error: {str(e)}")
+            raise ValueError(f"AI synthesis failed: {str(e)}")
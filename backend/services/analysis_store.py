@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+
+def default_db_path():
+    """
+    Location of the local SQLite database.
+
+    Vercel only allows writes under /tmp, so serverless instances keep the
+    store there (per instance); self-hosted deployments use backend/data/.
+    """
+    if os.getenv('ANALYSIS_DB_PATH'):
+        return os.getenv('ANALYSIS_DB_PATH')
+    if os.getenv('VERCEL'):
+        return '/tmp/pmeng.db'
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'pmeng.db')
+
+
+class AnalysisStore:
+    """Persists finished analyses (and their transcripts) by YouTube video ID."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_db_path()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def connection(self):
+        """Return this thread's SQLite connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        with self.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    video_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    transcript TEXT,
+                    etag TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Pre-rendered Notion blocks, valid while the analysis etag matches
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rendered_blocks (
+                    video_id TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL,
+                    blocks TEXT NOT NULL
+                )
+            """)
+            # Where each analysis was exported in each Notion workspace
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS notion_exports (
+                    video_id TEXT NOT NULL,
+                    token_key TEXT NOT NULL,
+                    record TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, token_key)
+                )
+            """)
+
+    @staticmethod
+    def compute_etag(payload_json):
+        return hashlib.sha256(payload_json.encode('utf-8')).hexdigest()[:32]
+
+    def save(self, video_id, analysis, transcript=None):
+        """
+        Insert or replace the analysis for a video.
+
+        Args:
+            video_id: YouTube video ID
+            analysis: Dict with video, pm_insights and english_expressions
+            transcript: Optional transcript segments ([{text, start, duration}])
+
+        Returns:
+            Stored record (see get())
+        """
+        payload_json = json.dumps(analysis, separators=(',', ':'), ensure_ascii=False)
+        transcript_json = json.dumps(transcript, separators=(',', ':'), ensure_ascii=False) if transcript else None
+        etag = self.compute_etag(payload_json)
+        now = time.time()
+
+        with self.connection() as conn:
+            conn.execute("""
+                INSERT INTO analyses (video_id, payload, transcript, etag, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    payload = excluded.payload,
+                    transcript = COALESCE(excluded.transcript, analyses.transcript),
+                    etag = excluded.etag,
+                    updated_at = excluded.updated_at
+            """, (video_id, payload_json, transcript_json, etag, now, now))
+
+        return self.get(video_id)
+
+    def get(self, video_id, include_transcript=False):
+        """
+        Look up a stored analysis.
+
+        Args:
+            video_id: YouTube video ID
+            include_transcript: Also decode the stored transcript segments
+
+        Returns:
+            Dict with video_id, payload_json, analysis, etag, created_at,
+            updated_at (and transcript) or None if not stored
+        """
+        row = self.connection().execute(
+            "SELECT * FROM analyses WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        record = {
+            "video_id": row["video_id"],
+            "payload_json": row["payload"],
+            "analysis": json.loads(row["payload"]),
+            "etag": row["etag"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if include_transcript:
+            record["transcript"] = json.loads(row["transcript"]) if row["transcript"] else None
+        return record
+
+    def delete(self, video_id):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM analyses WHERE video_id = ?", (video_id,))
+            conn.execute("DELETE FROM rendered_blocks WHERE video_id = ?", (video_id,))
+
+    def get_rendered_blocks(self, video_id, etag):
+        """Return cached Notion blocks for this version of the analysis, or None."""
+        row = self.connection().execute(
+            "SELECT blocks FROM rendered_blocks WHERE video_id = ? AND etag = ?", (video_id, etag)
+        ).fetchone()
+        return json.loads(row["blocks"]) if row else None
+
+    def save_rendered_blocks(self, video_id, etag, blocks):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO rendered_blocks (video_id, etag, blocks) VALUES (?, ?, ?)",
+                (video_id, etag, json.dumps(blocks, separators=(',', ':'), ensure_ascii=False))
+            )
+
+    def get_notion_export(self, video_id, token_key):
+        """Return the last Notion export record for this analysis and workspace, or None."""
+        row = self.connection().execute(
+            "SELECT record FROM notion_exports WHERE video_id = ? AND token_key = ?", (video_id, token_key)
+        ).fetchone()
+        return json.loads(row["record"]) if row else None
+
+    def save_notion_export(self, video_id, token_key, record):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO notion_exports (video_id, token_key, record, updated_at) VALUES (?, ?, ?, ?)",
+                (video_id, token_key, json.dumps(record, separators=(',', ':')), time.time())
+            )
@@ -0,0 +1,66 @@
+import gzip
+from datetime import datetime, timezone
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+
+def _pick_encoding(accept_encoding):
+    accepted = {part.split(';')[0].strip() for part in (accept_encoding or '').split(',')}
+    if HAS_BROTLI and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def cached_json_response(request, body_json, etag, last_modified, max_age=300):
+    """
+    Build a cacheable JSON response for an immutable-ish resource.
+
+    Sets ETag / Last-Modified / Cache-Control, answers conditional requests
+    with 304 Not Modified, and compresses the body with brotli or gzip
+    according to Accept-Encoding.
+
+    Args:
+        request: The current Flask request
+        body_json: Pre-serialized JSON string
+        etag: Strong entity tag (unquoted)
+        last_modified: Unix timestamp of the last change
+        max_age: Browser cache lifetime in seconds
+
+    Returns:
+        Flask Response
+    """
+    from flask import Response
+
+    response = Response(body_json, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(int(last_modified), tz=timezone.utc)
+    # Browsers revalidate after max_age; CDNs may serve stale while revalidating
+    response.headers['Cache-Control'] = (
+        f"public, max-age={max_age}, s-maxage={max_age * 12}, stale-while-revalidate=86400"
+    )
+    response.vary.add('Accept-Encoding')
+
+    # Handles If-None-Match / If-Modified-Since and turns the response into a 304
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    encoding = _pick_encoding(request.headers.get('Accept-Encoding'))
+    raw = body_json.encode('utf-8')
+    if encoding and len(raw) >= MIN_COMPRESS_BYTES:
+        if encoding == 'br':
+            response.set_data(brotli.compress(raw, quality=5))
+        else:
+            response.set_data(gzip.compress(raw, compresslevel=6))
+        response.headers['Content-Encoding'] = encoding
+
+    return response
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+STALE_JOB_ERROR = "Job stopped reporting progress (its worker exited or restarted)"
+
+
+class JobQueue:
+    """
+    Background job runner with job state persisted in the analysis database.
+
+    Jobs run on a bounded in-process thread pool. Their status, progress and
+    result live in SQLite so any worker process can answer status polls.
+
+    While a process holds queued or running jobs it refreshes their
+    updated_at every few seconds. An active job not refreshed for
+    JOB_LEASE_SECONDS (default 120) belonged to a worker that died or was
+    recycled: it is reported as failed and no longer de-duplicates new jobs.
+    """
+
+    def __init__(self, store, max_workers=None):
+        self.store = store
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('JOB_WORKERS', 2)),
+            thread_name_prefix='job'
+        )
+        self.lease_seconds = float(os.getenv('JOB_LEASE_SECONDS', 120))
+        self._owned = set()
+        self._owned_lock = threading.Lock()
+        self._heartbeat = None
+        with self.store.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    job_key TEXT,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress_done INTEGER NOT NULL DEFAULT 0,
+                    progress_total INTEGER NOT NULL DEFAULT 0,
+                    message TEXT,
+                    params TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (job_key, status)")
+            # Older databases may hold several active jobs per key; keep the newest
+            conn.execute("""
+                UPDATE jobs SET status = 'failed', error = 'Superseded by a newer job with the same key'
+                WHERE job_key IS NOT NULL AND status IN ('queued', 'running') AND created_at < (
+                    SELECT MAX(created_at) FROM jobs j2
+                    WHERE j2.job_key = jobs.job_key AND j2.status IN ('queued', 'running')
+                )
+            """)
+            # At most one queued or running job per key, enforced by SQLite across processes
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs (job_key) "
+                "WHERE job_key IS NOT NULL AND status IN ('queued', 'running')"
+            )
+
+    def _create(self, kind, job_key, params):
+        """
+        Insert a queued job, unless one with the same key is already active.
+
+        Returns:
+            Tuple of (job ID, True if it was created or False if it is the active job)
+        """
+        if job_key:
+            self._expire_stale()
+        while True:
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            with self.store.connection() as conn:
+                created = conn.execute(
+                    "INSERT INTO jobs (job_id, job_key, kind, status, params, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?, ?) ON CONFLICT DO NOTHING",
+                    (job_id, job_key, kind, json.dumps(params) if params is not None else None, now, now)
+                ).rowcount
+            if created:
+                return job_id, True
+            existing = self.find_active(job_key)
+            # The active job may have finished in between; then try again
+            if existing:
+                return existing, False
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        for key in ('result', 'params'):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key])
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self.store.connection() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.lease_seconds / 4)
+            with self._owned_lock:
+                owned = list(self._owned)
+            if owned:
+                with self.store.connection() as conn:
+                    conn.execute(
+                        f"UPDATE jobs SET updated_at = ? WHERE job_id IN ({', '.join('?' * len(owned))})",
+                        (time.time(), *owned)
+                    )
+
+    def _own(self, job_id):
+        """Keep a job's lease alive while this process holds it."""
+        with self._owned_lock:
+            self._owned.add(job_id)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True)
+                self._heartbeat.start()
+
+    def _expire_stale(self):
+        """Mark active jobs whose lease ran out as failed."""
+        with self.store.connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE status IN (?, ?) AND updated_at < ?",
+                (STALE_JOB_ERROR, time.time(), *ACTIVE_STATUSES, time.time() - self.lease_seconds)
+            )
+
+    def find_active(self, job_key):
+        """Return the ID of a queued or running job with this key, or None."""
+        self._expire_stale()
+        row = self.store.connection().execute(
+            "SELECT job_id FROM jobs WHERE job_key = ? AND status IN (?, ?) ORDER BY created_at DESC LIMIT 1",
+            (job_key, *ACTIVE_STATUSES)
+        ).fetchone()
+        return row["job_id"] if row else None
+
+    def _run(self, job_id, fn):
+        self._update(job_id, status='running')
+
+        def report_progress(done, total, message=None):
+            self._update(job_id, progress_done=done, progress_total=total, message=message)
+
+        try:
+            result = fn(report_progress)
+            self._update(job_id, status='succeeded', result=result)
+            return result
+        except Exception as e:
+            print(f"ERROR - Job {job_id} failed: {str(e)}")
+            self._update(job_id, status='failed', error=str(e))
+            raise
+        finally:
+            with self._owned_lock:
+                self._owned.discard(job_id)
+
+    def submit(self, kind, fn, job_key=None, params=None):
+        """
+        Enqueue `fn(report_progress)` to run in the background.
+
+        If a job with the same `job_key` is already queued or running, its ID
+        is returned instead of starting a duplicate (atomically, across
+        processes).
+
+        Returns:
+            Job ID string
+        """
+        job_id, created = self._create(kind, job_key, params)
+        if created:
+            self._own(job_id)
+            self.executor.submit(self._run, job_id, fn)
+        return job_id
+
+    def run_inline(self, kind, fn, job_key=None, params=None):
+        """
+        Run a job synchronously in the calling thread (used on serverless
+        platforms that freeze the process once the response is sent).
+
+        If a job with the same `job_key` is already queued or running, waits
+        for it and returns its result instead of running `fn` again.
+
+        Returns:
+            Tuple of (job ID, result)
+
+        Raises:
+            RuntimeError: If the job being waited for failed
+        """
+        job_id, created = self._create(kind, job_key, params)
+        if created:
+            self._own(job_id)
+            return job_id, self._run(job_id, fn)
+
+        # The lease bounds the wait: a job whose worker died is failed by get()
+        job = self.get(job_id)
+        while job["status"] in ACTIVE_STATUSES:
+            time.sleep(1)
+            job = self.get(job_id)
+        if job["status"] != 'succeeded':
+            raise RuntimeError(job["error"] or f"Job {job_id} failed")
+        return job_id, job["result"]
+
+    def get(self, job_id):
+        """
+        Return the public view of a job, or None if it does not exist.
+        """
+        self._expire_stale()
+        row = self.store.connection().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["job_id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": {"done": row["progress_done"], "total": row["progress_total"]},
+            "message": row["message"],
+            "params": json.loads(row["params"]) if row["params"] else None,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+from services.profiles import get_profile
+
+# Latency samples older than this no longer influence routing
+LATENCY_WINDOW_SECONDS = 600
+# Below this many samples a model's p95 is unknown and it is assumed healthy
+MIN_SAMPLES = 5
+
+
+class LatencyTracker:
+    """Sliding window of recent Gemini call latencies per model (per process)."""
+
+    def __init__(self, window_seconds=LATENCY_WINDOW_SECONDS, max_samples=500):
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.max_samples)).append((time.time(), seconds))
+
+    def _recent(self, model):
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            return np.array([s for t, s in self._samples.get(model, ()) if t >= cutoff])
+
+    def p95(self, model):
+        """95th percentile latency in seconds, or None with too few recent samples."""
+        recent = self._recent(model)
+        return float(np.percentile(recent, 95)) if len(recent) >= MIN_SAMPLES else None
+
+    def stats(self):
+        with self._lock:
+            models = list(self._samples)
+        result = {}
+        for model in models:
+            recent = self._recent(model)
+            result[model] = {
+                "samples": len(recent),
+                "p50": round(float(np.percentile(recent, 50)), 2) if len(recent) else None,
+                "p95": round(float(np.percentile(recent, 95)), 2) if len(recent) else None,
+            }
+        return result
+
+
+latency_tracker = LatencyTracker()
+
+
+class ModelRouter:
+    """
+    Picks a model and call strategy per request for the "auto" profile.
+
+    Transcript size decides the strategy: short transcripts go to the
+    cheapest model, long ones take the chunked path. Among the models
+    allowed for that size (cheapest first), the first whose live p95
+    latency is within the SLO wins, so traffic moves off a model as soon
+    as its latency spikes and returns once those slow samples age out of
+    the window.
+    """
+
+    def __init__(self, tracker=None):
+        self.tracker = tracker or latency_tracker
+        self.slo_seconds = float(os.getenv('ROUTER_SLO_SECONDS', 30))
+        self.short_tokens = int(os.getenv('ROUTER_SHORT_TOKENS', 6000))
+        self.long_tokens = int(os.getenv('ROUTER_LONG_TOKENS', 40000))
+        self.cheap_model = os.getenv('ROUTER_CHEAP_MODEL', get_profile('fast')['model'])
+        self.standard_model = os.getenv('ROUTER_STANDARD_MODEL', get_profile('balanced')['model'])
+
+    def route(self, transcript_tokens):
+        """
+        Build the profile for one request.
+
+        Args:
+            transcript_tokens: Estimated tokens of the full transcript (0 if none)
+
+        Returns:
+            Tuple of (profile dict named "auto", route dict explaining the choice)
+        """
+        if transcript_tokens <= self.short_tokens:
+            strategy, base, candidates = 'short', get_profile('fast'), [self.cheap_model, self.standard_model]
+        elif transcript_tokens >= self.long_tokens:
+            strategy, base, candidates = 'chunked', dict(get_profile('balanced'), chunk_minutes=20), \
+                [self.standard_model, self.cheap_model]
+        else:
+            strategy, base, candidates = 'standard', get_profile('balanced'), [self.standard_model, self.cheap_model]
+
+        latencies = {model: self.tracker.p95(model) for model in candidates}
+        model = next((m for m in candidates if latencies[m] is None or latencies[m] <= self.slo_seconds), None)
+        if model is None:
+            # Every candidate is over the SLO: take the least slow one
+            model = min(candidates, key=lambda m: latencies[m])
+        shifted = model != candidates[0]
+
+        profile = dict(base, name='auto', model=model)
+        if model == self.cheap_model:
+            # The lite tier is for speed; don't spend its latency on thinking
+            profile['thinking_budget'] = 0
+        route = {
+            "strategy": strategy,
+            "transcript_tokens": transcript_tokens,
+            "p95_seconds": {m: round(v, 2) if v is not None else None for m, v in latencies.items()},
+            "shifted": shifted,
+        }
+        if shifted:
+            print(f"DEBUG - Router: {candidates[0]} over {self.slo_seconds:g}s p95 SLO, using {model}")
+        return profile, route
@@ -1,45 +1,438 @@
 import os
+import json
+import math
+import time
+import hashlib
+import threading
+from itertools import islice
 from notion_client import Client
+from notion_client.errors import APIResponseError, HTTPResponseError, RequestTimeoutError
+
+from services.http_pool import get_httpx_client
+
+# Notion rejects more than 100 children in a single create/append request
+MAX_CHILDREN_PER_REQUEST = 100
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Rate-limited requests are rejected before Notion applies them, so only
+# these are safe to retry for writes that create something
+UNSAFE_RETRYABLE_STATUSES = {429}
+
+
+def notion_token_key(token):
+    """Stable key of a Notion access token (workspace) for caches and export records."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def block_has_children(block):
+    return bool(block.get(block['type'], {}).get('children'))
+
+
+class RateLimiter:
+    """Token bucket limiting requests per second; blocks callers until a slot is free."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Notion's limit (~3 requests/s on average) applies per integration token,
+# so every NotionService using the same token shares one bucket.
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter_for(token):
+    with _limiters_lock:
+        if token not in _limiters:
+            _limiters[token] = RateLimiter(float(os.getenv('NOTION_REQUESTS_PER_SECOND', 3)))
+        return _limiters[token]
+
+
+# Resolved export parent page per access token: {token_hash: (page_id, expires_at)}
+_parent_pages = {}
+_parent_pages_lock = threading.Lock()
+
 
 class NotionService:
     def __init__(self, auth_token=None):
         self.auth_token = auth_token or os.getenv('NOTION_TOKEN')
-        self.client = Client(auth=self.auth_token) if self.auth_token else None
+        # Each service gets its own httpx.Client (notion-client sets the auth
+        # header on it) backed by the process-wide connection pool.
+        self.client = Client(auth=self.auth_token, client=get_httpx_client()) if self.auth_token else None
+        self.limiter = _limiter_for(self.auth_token) if self.auth_token else None
+        self.max_retries = int(os.getenv('NOTION_MAX_RETRIES', 5))
+        self.parent_cache_ttl = int(os.getenv('NOTION_PARENT_CACHE_TTL', 3600))
+        self._token_key = notion_token_key(self.auth_token) if self.auth_token else None
 
-    def search_pages(self):
-        """Finds pages the integration has access to."""
+    def _call(self, method, idempotent=True, **kwargs):
+        """
+        Call a Notion endpoint through the rate limiter, retrying on 429 and
+        transient 5xx errors (honouring Retry-After when Notion sends it).
+
+        Creates and appends are not idempotent: a request that timed out or
+        got a 5xx may still have been applied, and repeating it would add a
+        second page or chunk. Those pass idempotent=False and are retried
+        on 429 only.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                return method(**kwargs)
+            except (APIResponseError, HTTPResponseError, RequestTimeoutError) as e:
+                status = getattr(e, 'status', None)
+                if idempotent:
+                    retryable = isinstance(e, RequestTimeoutError) or status in RETRYABLE_STATUSES
+                else:
+                    retryable = status in UNSAFE_RETRYABLE_STATUSES
+                if not retryable or attempt == self.max_retries:
+                    raise
+                headers = getattr(e, 'headers', None) or {}
+                retry_after = headers.get('retry-after')
+                delay = float(retry_after) if retry_after else min(2 ** attempt, 30)
+                print(f"Notion request failed ({status or 'timeout'}), retrying in {delay:.1f}s "
+                      f"(attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+
+    def iter_pages(self, page_size=10):
+        """
+        Lazily yield pages the integration has access to, fetching one
+        search result page at a time.
+        """
         if not self.client:
            raise ValueError("Notion client not initialized.")
-        results = self.client.search(filter={"value": "page", "property": "object"}).get("results")
-        return results
+        cursor = None
+        while True:
+            kwargs = {"filter": {"value": "page", "property": "object"}, "page_size": page_size}
+            if cursor:
+                kwargs["start_cursor"] = cursor
+            response = self._call(self.client.search, **kwargs)
+            yield from response.get("results", [])
+            if not response.get("has_more"):
+                return
+            cursor = response.get("next_cursor")
+
+    def search_pages(self):
+        """Finds pages the integration has access to (up to 100)."""
+        return list(islice(self.iter_pages(page_size=100), 100))
+
+    def find_parent_page(self):
+        """
+        Return the ID of the page exports are created under.
+
+        The first shared, non-archived page is used. The result is cached per
+        access token for NOTION_PARENT_CACHE_TTL seconds so exports skip the
+        workspace search; the search itself stops at the first usable page.
+
+        Returns:
+            Page ID string or None if the integration cannot see any page
+        """
+        now = time.time()
+        with _parent_pages_lock:
+            cached = _parent_pages.get(self._token_key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        for page in self.iter_pages():
+            if page.get("archived") or page.get("in_trash"):
+                continue
+            with _parent_pages_lock:
+                _parent_pages[self._token_key] = (page["id"], now + self.parent_cache_ttl)
+            return page["id"]
+        return None
+
+    def invalidate_parent_page(self):
+        with _parent_pages_lock:
+            _parent_pages.pop(self._token_key, None)
+
+    @property
+    def token_key(self):
+        """Stable hash of the access token, used to key per-workspace state."""
+        return self._token_key
+
+    def export_analysis(self, data, blocks=None, previous=None, database_id=None):
+        """
+        Export an analysis, updating the previously exported page if there is one.
+
+        With `previous` (the record returned by an earlier export), the page is
+        patched in place: unchanged leading blocks are kept, changed blocks of
+        the same shape are updated, and only the remaining tail is deleted and
+        re-appended. When that would cost more requests than starting over, the
+        old page is archived and a fresh one created instead. New pages go under
+        the cached parent page, which is re-resolved once on 404, or become rows
+        of `database_id` (see create_analysis_database).
+
+        Args:
+            data: Analysis payload (video, pm_insights, english_expressions)
+            blocks: Optional pre-rendered block list (see render_blocks)
+            previous: Optional export record from an earlier export
+            database_id: Optional database to add the analysis to as a row
+
+        Returns:
+            Export record: page_id, url, properties_hash, block_ids, block_hashes,
+            block_kinds and mode ('created', 'updated', 'replaced' or 'unchanged')
+
+        Raises:
+            ValueError: If no page is shared with the integration
+        """
+        if blocks is None:
+            blocks = self.render_blocks(data)
+        if database_id:
+            properties = self._row_properties(data)
+        else:
+            properties = self._title_properties(self._page_title(data))
+
+        if previous:
+            try:
+                export = self._update_analysis_page(previous, properties, blocks)
+                if export:
+                    return export
+            except APIResponseError as e:
+                if e.status != 404:
+                    raise
+                print(f"Previously exported Notion page {previous['page_id']} is gone, creating a new one")
+                previous = None
+
+        if database_id:
+            page, block_ids = self._create_page({"database_id": database_id}, properties, blocks)
+        else:
+            for attempt in range(2):
+                parent_page_id = self.find_parent_page()
+                if not parent_page_id:
+                    raise ValueError("No accessible pages found in Notion. Please share a page with the integration.")
+                try:
+                    page, block_ids = self._create_page({"page_id": parent_page_id}, properties, blocks)
+                    break
+                except APIResponseError as e:
+                    if e.status != 404 or attempt == 1:
+                        raise
+                    print(f"Notion parent page {parent_page_id} not found, rediscovering")
+                    self.invalidate_parent_page()
+
+        mode = "created"
+        if previous:
+            # Archive the superseded page so re-exports never leave duplicates
+            self._call(self.client.pages.update, page_id=previous['page_id'], archived=True)
+            mode = "replaced"
+        return self._export_record(page['id'], page.get('url'), properties, blocks, block_ids, mode)
+
+    def _update_analysis_page(self, previous, properties, blocks):
+        """
+        Patch a previously exported page to match `blocks`.
+
+        Returns:
+            Export record, or None if recreating the page is cheaper
+        """
+        old_ids = previous['block_ids']
+        old_hashes = previous['block_hashes']
+        old_kinds = previous['block_kinds']
+        new_hashes = [self.block_hash(b) for b in blocks]
 
-    def create_analysis_page(self, parent_page_id, data):
+        # Keep the common prefix untouched
+        keep = 0
+        while keep < min(len(old_hashes), len(new_hashes)) and old_hashes[keep] == new_hashes[keep]:
+            keep += 1
+
+        # Changed blocks with the same type and no nested children can be edited in place
+        updates = []
+        position = keep
+        while position < min(len(old_ids), len(blocks)):
+            block = blocks[position]
+            if old_hashes[position] != new_hashes[position]:
+                if self.block_kind(block) != old_kinds[position] or block_has_children(block):
+                    break
+                updates.append((old_ids[position], block))
+            position += 1
+
+        deletes = old_ids[position:]
+        appends = blocks[position:]
+        properties_changed = previous.get('properties_hash') != self.block_hash(properties)
+
+        incremental_cost = (len(updates) + len(deletes) + int(properties_changed)
+                            + math.ceil(len(appends) / MAX_CHILDREN_PER_REQUEST))
+        # create + list children + archive old page + extra append chunks
+        recreate_cost = 3 + math.ceil(max(len(blocks) - MAX_CHILDREN_PER_REQUEST, 0) / MAX_CHILDREN_PER_REQUEST)
+        if incremental_cost > recreate_cost:
+            return None
+
+        page_id = previous['page_id']
+        if incremental_cost == 0:
+            return dict(previous, mode="unchanged")
+
+        if properties_changed:
+            self._call(self.client.pages.update, page_id=page_id, properties=properties)
+        for block_id, block in updates:
+            block_type = block['type']
+            self._call(self.client.blocks.update, block_id=block_id, **{block_type: block[block_type]})
+        for block_id in deletes:
+            self._call(self.client.blocks.delete, block_id=block_id)
+        appended_ids = self.append_blocks(page_id, appends) if appends else []
+
+        block_ids = old_ids[:position] + appended_ids
+        return self._export_record(page_id, previous.get('url'), properties, blocks, block_ids, "updated")
+
+    def _export_record(self, page_id, url, properties, blocks, block_ids, mode):
+        return {
+            "page_id": page_id,
+            "url": url,
+            "properties_hash": self.block_hash(properties),
+            "block_ids": block_ids,
+            "block_hashes": [self.block_hash(b) for b in blocks],
+            "block_kinds": [self.block_kind(b) for b in blocks],
+            "mode": mode,
+        }
+
+    @staticmethod
+    def block_hash(block):
+        return hashlib.sha1(json.dumps(block, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def block_kind(block):
+        """Block type, suffixed with '+children' when the block nests children."""
+        return block['type'] + ('+children' if block_has_children(block) else '')
+
+    def append_blocks(self, block_id, blocks):
+        """
+        Append blocks under a page or block in chunks of at most 100.
+
+        Chunks are sent in order (Notion appends to the end of the parent),
+        each one through the shared rate limiter (retried only when rate
+        limited, so a chunk is never appended twice).
+
+        Args:
+            block_id: Page or block ID to append to
+            blocks: List of Notion block objects
+
+        Returns:
+            IDs of the created top-level blocks, in order
+        """
+        if not self.client:
+            raise ValueError("Notion client not initialized. Invalid or missing token.")
+
+        created_ids = []
+        for start in range(0, len(blocks), MAX_CHILDREN_PER_REQUEST):
+            chunk = blocks[start:start + MAX_CHILDREN_PER_REQUEST]
+            response = self._call(self.client.blocks.children.append, idempotent=False, block_id=block_id,
+                                  children=chunk)
+            created_ids.extend(block['id'] for block in response.get('results', []))
+        return created_ids
+
+    def _create_page(self, parent, properties, blocks):
+        """
+        Create a page with the first chunk of blocks and append the rest.
+
+        Returns:
+            Tuple of (page object, IDs of its top-level blocks)
+        """
+        new_page = self._call(
+            self.client.pages.create,
+            idempotent=False,
+            parent=parent,
+            properties=properties,
+            children=blocks[:MAX_CHILDREN_PER_REQUEST]
+        )
+        # pages.create does not return the created children, so list them once
+        first_chunk = self._call(
+            self.client.blocks.children.list, block_id=new_page['id'], page_size=MAX_CHILDREN_PER_REQUEST
+        )
+        block_ids = [block['id'] for block in first_chunk.get('results', [])]
+        if len(blocks) > MAX_CHILDREN_PER_REQUEST:
+            block_ids += self.append_blocks(new_page['id'], blocks[MAX_CHILDREN_PER_REQUEST:])
+        return new_page, block_ids
+
+    def create_analysis_page(self, parent_page_id, data, blocks=None):
         """
         Creates a new page in Notion with the analysis results.
+
+        Args:
+            parent_page_id: Notion page to create the analysis under
+            data: Analysis payload (video, pm_insights, english_expressions)
+            blocks: Optional pre-rendered block list (see render_blocks)
         """
         if not self.client:
             raise ValueError("Notion client not initialized. Invalid or missing token.")
 
-        video_title = data.get('video', {}).get('title', 'YouTube Analysis')
-        video_url = data.get('video', {}).get('url', '')
-        
-        # Create the page
-        new_page = self.client.pages.create(
-            parent={"page_id": parent_page_id},
-            properties={
-                "title": [
-                    {
-                        "text": {
-                            "content": f"Analysis: {video_title}"
-                        }
-                    }
-                ]
-            },
-            children=self._build_blocks(data, video_url)
+        if blocks is None:
+            blocks = self.render_blocks(data)
+
+        new_page, _ = self._create_page(
+            {"page_id": parent_page_id}, self._title_properties(self._page_title(data)), blocks
         )
         return new_page
 
-    def _build_blocks(self, data, video_url):
+    @staticmethod
+    def _page_title(data):
+        return f"Analysis: {data.get('video', {}).get('title', 'YouTube Analysis')}"
+
+    def create_analysis_database(self, parent_page_id, title="PM-ENG Analyses"):
+        """
+        Create a database for bulk exports, one row per analysis.
+
+        Returns:
+            Database object (id, url, ...)
+        """
+        if not self.client:
+            raise ValueError("Notion client not initialized. Invalid or missing token.")
+        return self._call(
+            self.client.databases.create,
+            idempotent=False,
+            parent={"type": "page_id", "page_id": parent_page_id},
+            title=[{"type": "text", "text": {"content": title}}],
+            properties={
+                "Name": {"title": {}},
+                "Channel": {"rich_text": {}},
+                "URL": {"url": {}},
+                "Insights": {"number": {}},
+                "Expressions": {"number": {}},
+            }
+        )
+
+    @staticmethod
+    def _row_properties(data):
+        """Database row properties for an analysis (see create_analysis_database)."""
+        video = data.get('video', {})
+        return {
+            "Name": {"title": [{"text": {"content": video.get('title', 'YouTube Analysis')}}]},
+            "Channel": {"rich_text": [{"text": {"content": video.get('channel', '')}}]},
+            "URL": {"url": video.get('url') or None},
+            "Insights": {"number": len(data.get('pm_insights', []))},
+            "Expressions": {"number": len(data.get('english_expressions', []))},
+        }
+
+    @staticmethod
+    def _title_properties(title):
+        return {
+            "title": [
+                {
+                    "text": {
+                        "content": title
+                    }
+                }
+            ]
+        }
+
+    @staticmethod
+    def render_blocks(data):
+        """Build the page body blocks for an analysis payload."""
+        return NotionService._build_blocks(data, data.get('video', {}).get('url', ''))
+
+    @staticmethod
+    def _build_blocks(data, video_url):
         blocks = []
         
         # Video link
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Per-stage counters since process start, for the metrics endpoint
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def code_fingerprint(fn):
+    """
+    Short hash of a function's bytecode and constants (which include its
+    prompt strings), so a stage's cached output is invalidated whenever
+    the code or prompt behind it changes.
+    """
+    fn = getattr(fn, '__func__', fn)
+    code = fn.__code__
+
+    def constants(code):
+        for const in code.co_consts:
+            if hasattr(const, 'co_code'):
+                yield from constants(const)
+            else:
+                yield repr(const)
+        yield code.co_code.hex()
+
+    return hashlib.sha256("\n".join(constants(code)).encode('utf-8')).hexdigest()[:12]
+
+
+class StageError(ValueError):
+    """A stage failed or timed out. `stage` names it; `cause` is the original error."""
+
+    def __init__(self, stage, cause):
+        super().__init__(str(cause))
+        self.stage = stage
+        self.cause = cause
+
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    Args:
+        name: Stage name, also the name of its output unless `outputs` is given
+        fn: Callable taking the declared inputs as keyword arguments. Returns
+            the output value, or a dict keyed by output name for several outputs
+        inputs: Names of values (pipeline inputs or other stages' outputs) it needs
+        outputs: Names of the values it produces (default: [name])
+        timeout: Seconds before the stage is abandoned (PIPELINE_STAGE_TIMEOUT, default 150)
+        cache: Whether outputs are cached by the hash of the inputs
+        ttl: Cache lifetime in seconds (None: until the inputs or version change)
+        version: Extra cache-key component; change it to re-run only this stage
+        cache_if: Optional predicate on the outputs dict; outputs it rejects
+            (e.g. a degraded fallback) are not cached, so the next run retries
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=None, timeout=None, cache=True, ttl=None, version=None,
+                 cache_if=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs or [name])
+        self.timeout = timeout or float(os.getenv('PIPELINE_STAGE_TIMEOUT', 150))
+        self.cache = cache
+        self.ttl = ttl
+        self.version = version or code_fingerprint(fn)
+        self.cache_if = cache_if
+
+    def cache_key(self, values):
+        material = json.dumps(
+            {"stage": self.name, "version": self.version, "inputs": {k: values[k] for k in self.inputs}},
+            sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class StageCache:
+    """Stage outputs keyed by content hash, kept in the analysis database."""
+
+    def __init__(self, store):
+        self.store = store
+        with self.store.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stage_cache (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def get(self, key, ttl=None):
+        row = self.store.connection().execute(
+            "SELECT output, created_at FROM stage_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (ttl is not None and time.time() - row["created_at"] > ttl):
+            return None
+        return json.loads(row["output"])
+
+    def put(self, key, stage, output):
+        with self.store.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO stage_cache (key, stage, output, created_at) VALUES (?, ?, ?, ?)",
+                (key, stage, json.dumps(output, separators=(',', ':'), ensure_ascii=False), time.time())
+            )
+
+
+class Pipeline:
+    """
+    Runs stages as a DAG: a stage starts as soon as all of its inputs exist,
+    so independent stages run in parallel on a small thread pool. Cached
+    stages are served from the StageCache when their inputs and version are
+    unchanged.
+    """
+
+    def __init__(self, stages, cache=None, max_workers=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache = cache
+        self.max_workers = max_workers or int(os.getenv('PIPELINE_WORKERS', 4))
+
+        producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"Output '{output}' is produced by both {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+        self.producers = producers
+
+    def _required(self, targets, available):
+        """Names of the stages needed to produce `targets` from `available` inputs."""
+        needed, pending = set(), list(targets)
+        while pending:
+            name = pending.pop()
+            if name in available:
+                continue
+            producer = self.producers.get(name)
+            if producer is None:
+                raise ValueError(f"No stage produces '{name}'")
+            if producer not in needed:
+                needed.add(producer)
+                pending.extend(self.stages[producer].inputs)
+        return needed
+
+    def _execute(self, stage, values, use_cache):
+        """Run (or fetch from cache) one stage. Returns (outputs dict, status)."""
+        key = stage.cache_key(values) if self.cache and stage.cache else None
+        if key and use_cache:
+            cached = self.cache.get(key, ttl=stage.ttl)
+            if cached is not None:
+                return cached, 'cached'
+
+        result = stage.fn(**{name: values[name] for name in stage.inputs})
+        outputs = result if len(stage.outputs) > 1 else {stage.outputs[0]: result}
+        if key and (stage.cache_if is None or stage.cache_if(outputs)):
+            self.cache.put(key, stage.name, outputs)
+        return outputs, 'ran'
+
+    def run(self, inputs, targets, refresh=()):
+        """
+        Produce `targets` from `inputs`.
+
+        Args:
+            inputs: Dict of initial values (e.g. video_id)
+            targets: Names of the values wanted
+            refresh: Stage names to re-run instead of reading their cached
+                output (their fresh outputs are still cached), or True for all
+
+        Returns:
+            Tuple of (values dict, metrics dict keyed by stage name)
+
+        Raises:
+            StageError: The first stage that failed or timed out
+        """
+        if refresh is not True:
+            refresh = set(refresh or ())
+        values = dict(inputs)
+        remaining = self._required(targets, values)
+        metrics = {}
+        running = {}  # future -> (stage, started, deadline)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stage')
+
+        try:
+            while remaining or running:
+                for name in sorted(remaining):
+                    stage = self.stages[name]
+                    if all(i in values for i in stage.inputs):
+                        remaining.discard(name)
+                        started = time.perf_counter()
+                        use_cache = refresh is not True and name not in refresh
+                        future = executor.submit(self._execute, stage, dict(values), use_cache)
+                        running[future] = (stage, started, started + stage.timeout)
+                if not running:
+                    raise ValueError(f"Stages {sorted(remaining)} have inputs that are never produced (cycle?)")
+
+                next_deadline = min(deadline for _, _, deadline in running.values())
+                done, _ = wait(running, timeout=max(0, next_deadline - time.perf_counter()),
+                               return_when=FIRST_COMPLETED)
+
+                if not done:
+                    stage, started, _ = min(running.values(), key=lambda r: r[2])
+                    self._record(stage.name, 'timeout', time.perf_counter() - started, metrics)
+                    raise StageError(stage.name, TimeoutError(f"Stage {stage.name} timed out after {stage.timeout:g}s"))
+
+                for future in done:
+                    stage, started, _ = running.pop(future)
+                    try:
+                        outputs, status = future.result()
+                    except Exception as e:
+                        self._record(stage.name, 'failed', time.perf_counter() - started, metrics)
+                        raise StageError(stage.name, e) from e
+                    self._record(stage.name, status, time.perf_counter() - started, metrics)
+                    values.update(outputs)
+        finally:
+            # Abandoned (timed-out) stages finish in the background; don't wait for them
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return {name: values[name] for name in targets}, metrics
+
+    @staticmethod
+    def _record(name, status, seconds, metrics):
+        metrics[name] = {"status": status, "seconds": round(seconds, 3)}
+        print(f"DEBUG - Stage {name}: {status} in {seconds:.2f}s")
+        with _stats_lock:
+            stats = _stats.setdefault(name, {"ran": 0, "cached": 0, "failed": 0, "timeout": 0,
+                                             "total_seconds": 0.0, "max_seconds": 0.0})
+            stats[status] += 1
+            stats["total_seconds"] = round(stats["total_seconds"] + seconds, 3)
+            stats["max_seconds"] = round(max(stats["max_seconds"], seconds), 3)
+
+
+def pipeline_stats():
+    """Per-stage run/cache/failure counts and timings since process start."""
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
@@ -0,0 +1,107 @@
+import os
+
+# Named latency profiles. Each one sets the Gemini model and generation
+# limits plus how much of the transcript is sent:
+#   thinking_budget:   thinking tokens (0 = off, -1 = model decides)
+#   max_output_tokens: output cap (thinking counts against it on 2.5 models)
+#   max_input_tokens:  prompt budget per call; longer transcripts are chunked
+#                      (expressions) or digested (PM insights) to fit, and
+#                      anything still over is compacted, then truncated
+#   pm_digest_budget:  token budget of the PM insights digest (None = full transcript)
+#   expression_ratio:  share of caption windows sent for expressions (None = all)
+#   chunk_minutes:     split the expression transcript into chunks of this
+#                      length, analyzed in parallel (None = one call)
+PROFILES = {
+    "fast": {
+        "model": "gemini-2.5-flash-lite",
+        "thinking_budget": 0,
+        "max_output_tokens": 2048,
+        "max_input_tokens": 16000,
+        "pm_digest_budget": 3000,
+        "expression_ratio": 0.05,
+        "chunk_minutes": None,
+    },
+    "balanced": {
+        "model": "gemini-2.5-flash",
+        "thinking_budget": 1024,
+        "max_output_tokens": 8192,
+        "max_input_tokens": 48000,
+        "pm_digest_budget": 6000,
+        "expression_ratio": 0.1,
+        "chunk_minutes": None,
+    },
+    "thorough": {
+        "model": "gemini-2.5-pro",
+        "thinking_budget": -1,
+        "max_output_tokens": 16384,
+        "max_input_tokens": 200000,
+        "pm_digest_budget": None,
+        "expression_ratio": None,
+        "chunk_minutes": 20,
+    },
+}
+
+
+def default_profile_name():
+    """Deployment-wide profile (LATENCY_PROFILE, default 'balanced')."""
+    return os.getenv('LATENCY_PROFILE', 'balanced')
+
+
+def get_profile(name=None):
+    """
+    Resolve a latency profile by name ("auto" is routed per request, see
+    services.model_router).
+
+    The model and input budget of each profile can be overridden per
+    deployment, e.g. LATENCY_PROFILE_FAST_MODEL=gemini-2.0-flash-lite or
+    LATENCY_PROFILE_FAST_MAX_INPUT_TOKENS=8000.
+
+    Args:
+        name: Profile name; defaults to the deployment profile
+
+    Returns:
+        Profile dict including its name
+
+    Raises:
+        ValueError: If the profile does not exist
+    """
+    name = name or default_profile_name()
+    if name == 'auto':
+        # Placeholder until ModelRouter picks the model once the transcript is known
+        return dict(get_profile('balanced'), name='auto')
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile '{name}'. Choose one of: {', '.join(PROFILES)}, auto")
+    profile = dict(PROFILES[name], name=name)
+    profile["model"] = os.getenv(f"LATENCY_PROFILE_{name.upper()}_MODEL", profile["model"])
+    profile["max_input_tokens"] = int(os.getenv(f"LATENCY_PROFILE_{name.upper()}_MAX_INPUT_TOKENS",
+                                                profile["max_input_tokens"]))
+    return profile
+
+
+def transcription_profile():
+    """
+    Profile for the one-off transcription of a video without captions
+    (VIDEO_TRANSCRIBE_MODEL, default the balanced model). Frames are sampled
+    at low media resolution: the speech carries what the analyses need.
+    """
+    return {
+        "name": "transcription",
+        "model": os.getenv('VIDEO_TRANSCRIBE_MODEL', PROFILES['balanced']['model']),
+        "thinking_budget": 0,
+        "max_output_tokens": 65535,
+        "media_resolution": "MEDIA_RESOLUTION_LOW",
+    }
+
+
+def generation_config(profile, response_mime_type="application/json", temperature=0.7):
+    """Gemini generate_content config for a profile."""
+    config = {
+        "temperature": temperature,
+        "max_output_tokens": profile["max_output_tokens"],
+        "response_mime_type": response_mime_type,
+    }
+    if profile.get("thinking_budget") is not None:
+        config["thinking_config"] = {"thinking_budget": profile["thinking_budget"]}
+    if profile.get("media_resolution"):
+        config["media_resolution"] = profile["media_resolution"]
+    return config
@@ -0,0 +1,253 @@
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from services.expression_prefilter import STOPWORDS
+
+_TOKEN = re.compile(r"[a-z][a-z']{2,}")
+
+# Titles and insights summarize what a video is about, so they count for
+# more than any single stretch of transcript.
+TITLE_WEIGHT = 5
+INSIGHT_WEIGHT = 2
+
+
+def term_counts(analysis, transcript=None):
+    """Weighted term counts for one analysis (video title, insights, transcript)."""
+    counts = Counter()
+
+    def add(text, weight=1):
+        for token in _TOKEN.findall((text or '').lower()):
+            if token not in STOPWORDS:
+                counts[token] += weight
+
+    add(analysis.get('video', {}).get('title'), TITLE_WEIGHT)
+    for insight in analysis.get('pm_insights', []):
+        add(insight.get('title'), INSIGHT_WEIGHT)
+        add(insight.get('description'), INSIGHT_WEIGHT)
+    for segment in transcript or []:
+        add(segment.get('text'))
+    return counts
+
+
+class RelatedIndex:
+    """
+    "More like this" over stored analyses using TF-IDF cosine similarity.
+
+    Per-video term counts are persisted in the analysis database, so they are
+    computed once per analysis version. Each process keeps the counts in
+    memory as sparse rows plus a document-frequency vector, both updated
+    incrementally; the normalized TF-IDF matrix is rebuilt in one vectorized
+    pass only after the set of videos changes. Never calls the LLM.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        with self.store.connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS related_terms (
+                    video_id TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    count REAL NOT NULL,
+                    PRIMARY KEY (video_id, term)
+                );
+
+                CREATE TABLE IF NOT EXISTS related_indexed (
+                    video_id TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL
+                );
+            """)
+        self._lock = threading.Lock()
+        self._vocab = {}
+        self._document_frequency = np.zeros(0)
+        self._rows = {}       # video_id -> (etag, term columns, counts)
+        self._matrix = None   # (video_ids, row ids, columns, weights), rebuilt when stale
+
+    def add_analysis(self, video_id):
+        """
+        Compute and store the term counts of one stored analysis.
+
+        Returns:
+            True if the index was updated
+        """
+        stored = self.store.get(video_id, include_transcript=True)
+        if not stored:
+            return False
+
+        conn = self.store.connection()
+        row = conn.execute("SELECT etag FROM related_indexed WHERE video_id = ?", (video_id,)).fetchone()
+        if row and row["etag"] == stored['etag']:
+            return False
+
+        counts = term_counts(stored['analysis'], stored.get('transcript'))
+        with conn:
+            conn.execute("DELETE FROM related_terms WHERE video_id = ?", (video_id,))
+            conn.executemany(
+                "INSERT INTO related_terms (video_id, term, count) VALUES (?, ?, ?)",
+                ((video_id, term, count) for term, count in counts.items())
+            )
+            conn.execute("INSERT OR REPLACE INTO related_indexed (video_id, etag) VALUES (?, ?)",
+                         (video_id, stored['etag']))
+
+        with self._lock:
+            self._set_row(video_id, stored['etag'], counts)
+        return True
+
+    def sync(self):
+        """
+        Index every stored analysis that is missing or stale in the index.
+
+        Returns:
+            Number of analyses (re)indexed
+        """
+        stale = self.store.connection().execute("""
+            SELECT a.video_id FROM analyses a
+            LEFT JOIN related_indexed r ON r.video_id = a.video_id
+            WHERE r.etag IS NULL OR r.etag != a.etag
+        """).fetchall()
+        return sum(1 for row in stale if self.add_analysis(row["video_id"]))
+
+    def _set_row(self, video_id, etag, counts):
+        """Replace one video's in-memory row, keeping document frequencies in step."""
+        self._drop_row(video_id)
+        columns = np.fromiter((self._vocab.setdefault(term, len(self._vocab)) for term in counts),
+                              dtype=np.int64, count=len(counts))
+        if len(self._vocab) > len(self._document_frequency):
+            self._document_frequency = np.concatenate(
+                [self._document_frequency, np.zeros(len(self._vocab) - len(self._document_frequency))]
+            )
+        self._document_frequency[columns] += 1
+        self._rows[video_id] = (etag, columns, np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+        self._matrix = None
+
+    def _drop_row(self, video_id):
+        previous = self._rows.pop(video_id, None)
+        if previous:
+            self._document_frequency[previous[1]] -= 1
+            self._matrix = None
+
+    def _refresh(self):
+        """Pick up analyses indexed (or removed) by other processes since the last call."""
+        indexed = {row["video_id"]: row["etag"]
+                   for row in self.store.connection().execute("SELECT video_id, etag FROM related_indexed")}
+
+        for video_id in [v for v in self._rows if v not in indexed]:
+            self._drop_row(video_id)
+
+        for video_id, etag in indexed.items():
+            current = self._rows.get(video_id)
+            if current and current[0] == etag:
+                continue
+            counts = {row["term"]: row["count"] for row in self.store.connection().execute(
+                "SELECT term, count FROM related_terms WHERE video_id = ?", (video_id,))}
+            self._set_row(video_id, etag, counts)
+
+    def _build_matrix(self):
+        """L2-normalized TF-IDF rows in coordinate form, one vectorized pass."""
+        video_ids = list(self._rows)
+        n = len(video_ids)
+        if n == 0:
+            return video_ids, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        lengths = [len(self._rows[v][1]) for v in video_ids]
+        row_ids = np.repeat(np.arange(n), lengths)
+        columns = np.concatenate([self._rows[v][1] for v in video_ids])
+        counts = np.concatenate([self._rows[v][2] for v in video_ids])
+
+        idf = np.log((1 + n) / (1 + self._document_frequency)) + 1
+        weights = np.log1p(counts) * idf[columns]
+        norms = np.sqrt(np.bincount(row_ids, weights=weights ** 2, minlength=n))
+        weights /= np.maximum(norms, 1e-12)[row_ids]
+        return video_ids, row_ids, columns, weights
+
+    def _top_k(self, query_weights, limit, exclude=None):
+        """
+        Cosine similarity of a dense query vector (over the vocabulary)
+        against every video at once; returns [(video_id, score)] best first.
+        """
+        video_ids, row_ids, columns, weights = self._matrix
+        scores = np.bincount(row_ids, weights=weights * query_weights[columns], minlength=len(video_ids))
+        if exclude in self._rows:
+            scores[video_ids.index(exclude)] = -1
+
+        k = min(limit, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(video_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def _query(self, columns, counts, limit, exclude=None):
+        """Top-k for a sparse query row. Caller holds the lock and has refreshed."""
+        if self._matrix is None:
+            self._matrix = self._build_matrix()
+
+        idf = np.log((1 + len(self._rows)) / (1 + self._document_frequency)) + 1
+        query = np.zeros(len(self._vocab))
+        query[columns] = np.log1p(counts) * idf[columns]
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        return self._top_k(query / norm, limit, exclude=exclude)
+
+    def related(self, video_id, limit=10):
+        """
+        Most similar other analyzed videos.
+
+        Returns:
+            List of result dicts (best first), or None if the video is not indexed
+        """
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(video_id)
+            if row is None:
+                return None
+            scored = self._query(row[1], row[2], limit, exclude=video_id)
+        return self._describe(scored)
+
+    def related_to_text(self, text, limit=10, exclude=None):
+        """
+        Analyzed videos most similar to free text (e.g. the title of a video
+        whose analysis is still running).
+
+        Returns:
+            List of result dicts, best first
+        """
+        counts = term_counts({"video": {"title": text}})
+        with self._lock:
+            self._refresh()
+            known = [(self._vocab[t], c) for t, c in counts.items() if t in self._vocab]
+            if not known:
+                return []
+            columns, weights = zip(*known)
+            scored = self._query(np.array(columns), np.array(weights, dtype=np.float64), limit, exclude=exclude)
+        return self._describe(scored)
+
+    def _describe(self, scored):
+        """Attach stored video metadata to (video_id, similarity) pairs."""
+        if not scored:
+            return []
+        placeholders = ", ".join("?" for _ in scored)
+        rows = self.store.connection().execute(f"""
+            SELECT video_id,
+                   json_extract(payload, '$.video.title') AS title,
+                   json_extract(payload, '$.video.channel') AS channel,
+                   json_extract(payload, '$.video.thumbnail') AS thumbnail
+            FROM analyses WHERE video_id IN ({placeholders})
+        """, [video_id for video_id, _ in scored]).fetchall()
+        videos = {row["video_id"]: row for row in rows}
+
+        results = []
+        for video_id, similarity in scored:
+            video = videos.get(video_id)
+            results.append({
+                "video_id": video_id,
+                "title": video["title"] if video else None,
+                "channel": video["channel"] if video else None,
+                "thumbnail": video["thumbnail"] if video else None,
+                "url": f"https://www.youtube.com/watch?v={video_id}",
+                "similarity": round(similarity, 4),
+            })
+        return results
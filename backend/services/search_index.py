@@ -0,0 +1,172 @@
+import re
+
+# Consecutive captions are merged into windows of roughly this many seconds
+# so phrases spanning caption boundaries still match and the index stays small.
+WINDOW_SECONDS = 30
+
+
+def timestamp_url(video_id, seconds):
+    return f"https://www.youtube.com/watch?v={video_id}&t={int(seconds or 0)}s"
+
+
+def to_match_query(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression: every word must match,
+    the last one as a prefix so results show up while typing.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 index over stored transcripts, PM insights and English
+    expressions, kept in the analysis database.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        with self.store.connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS search_docs (
+                    id INTEGER PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    start REAL,
+                    title TEXT,
+                    text TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS search_docs_video ON search_docs (video_id);
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+                    title, text, content='search_docs', content_rowid='id',
+                    tokenize='porter unicode61'
+                );
+
+                -- Keep the external-content FTS table in sync with search_docs
+                CREATE TRIGGER IF NOT EXISTS search_docs_ai AFTER INSERT ON search_docs BEGIN
+                    INSERT INTO search_fts (rowid, title, text) VALUES (new.id, new.title, new.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS search_docs_ad AFTER DELETE ON search_docs BEGIN
+                    INSERT INTO search_fts (search_fts, rowid, title, text)
+                    VALUES ('delete', old.id, old.title, old.text);
+                END;
+
+                -- Which version (etag) of each analysis is currently indexed
+                CREATE TABLE IF NOT EXISTS search_indexed (
+                    video_id TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL
+                );
+            """)
+
+    @staticmethod
+    def _documents(analysis, transcript):
+        """Yield (kind, start, title, text) rows for one analysis."""
+        window, window_start = [], None
+        for segment in transcript or []:
+            if window_start is None:
+                window_start = segment.get('start', 0)
+            window.append(segment.get('text', ''))
+            if segment.get('start', 0) - window_start >= WINDOW_SECONDS:
+                yield 'transcript', window_start, None, ' '.join(window)
+                window, window_start = [], None
+        if window:
+            yield 'transcript', window_start, None, ' '.join(window)
+
+        for insight in analysis.get('pm_insights', []):
+            yield 'insight', None, insight.get('title', ''), insight.get('description', '')
+
+        for expr in analysis.get('english_expressions', []):
+            yield 'expression', expr.get('timestamp'), expr.get('phrase', ''), expr.get('example', '')
+
+    def index_analysis(self, video_id):
+        """
+        (Re)index one stored analysis. No-op if this version is already indexed.
+
+        Returns:
+            True if the index was updated
+        """
+        stored = self.store.get(video_id, include_transcript=True)
+        if not stored:
+            return False
+
+        conn = self.store.connection()
+        row = conn.execute("SELECT etag FROM search_indexed WHERE video_id = ?", (video_id,)).fetchone()
+        if row and row["etag"] == stored['etag']:
+            return False
+
+        with conn:
+            conn.execute("DELETE FROM search_docs WHERE video_id = ?", (video_id,))
+            conn.executemany(
+                "INSERT INTO search_docs (video_id, kind, start, title, text) VALUES (?, ?, ?, ?, ?)",
+                ((video_id, *doc) for doc in self._documents(stored['analysis'], stored.get('transcript')))
+            )
+            conn.execute("INSERT OR REPLACE INTO search_indexed (video_id, etag) VALUES (?, ?)",
+                         (video_id, stored['etag']))
+        return True
+
+    def sync(self):
+        """
+        Index every stored analysis that is missing or stale in the index.
+
+        Returns:
+            Number of analyses (re)indexed
+        """
+        stale = self.store.connection().execute("""
+            SELECT a.video_id FROM analyses a
+            LEFT JOIN search_indexed s ON s.video_id = a.video_id
+            WHERE s.etag IS NULL OR s.etag != a.etag
+        """).fetchall()
+        return sum(1 for row in stale if self.index_analysis(row["video_id"]))
+
+    def search(self, query, limit=20, kind=None):
+        """
+        Full-text search across all indexed analyses.
+
+        Args:
+            query: Free-text query
+            limit: Maximum number of results
+            kind: Optional filter: 'transcript', 'insight' or 'expression'
+
+        Returns:
+            List of result dicts ranked by BM25, each with a snippet and a
+            timestamp_url deep link when the hit has a position in the video
+        """
+        match = to_match_query(query)
+        if not match:
+            return []
+
+        sql = """
+            SELECT d.video_id, d.kind, d.start, d.title, d.text,
+                   snippet(search_fts, -1, '<mark>', '</mark>', '…', 16) AS snippet,
+                   json_extract(a.payload, '$.video.title') AS video_title
+            FROM search_fts
+            JOIN search_docs d ON d.id = search_fts.rowid
+            LEFT JOIN analyses a ON a.video_id = d.video_id
+            WHERE search_fts MATCH ?
+        """
+        params = [match]
+        if kind:
+            sql += " AND d.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        results = []
+        for row in self.store.connection().execute(sql, params):
+            result = {
+                "video_id": row["video_id"],
+                "video_title": row["video_title"],
+                "kind": row["kind"],
+                "title": row["title"],
+                "snippet": row["snippet"],
+            }
+            if row["start"] is not None:
+                result["start"] = row["start"]
+                result["timestamp_url"] = timestamp_url(row["video_id"], row["start"])
+            results.append(result)
+        return results
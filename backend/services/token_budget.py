@@ -0,0 +1,123 @@
+import re
+import threading
+
+from services.transcript_digest import CHARS_PER_TOKEN
+
+# Weight of the newest prompt when re-calibrating a model's chars per token
+CALIBRATION_ALPHA = 0.2
+
+TRUNCATION_NOTE = "[... transcript truncated to fit the input budget ...]"
+
+_SPACES = re.compile(r"[ \t]+")
+
+
+def compact_text(text):
+    """Collapse runs of spaces and drop blank and repeated consecutive lines (common in auto-captions)."""
+    lines, previous = [], None
+    for line in text.splitlines():
+        line = _SPACES.sub(' ', line).strip()
+        if line and line != previous:
+            lines.append(line)
+        previous = line
+    return "\n".join(lines)
+
+
+class TokenBudget:
+    """
+    Local token estimates for Gemini prompts, calibrated per model.
+
+    Estimates start at CHARS_PER_TOKEN and are corrected from the actual
+    prompt token counts Gemini reports with every response (and from
+    count_tokens when TOKEN_COUNT_CALIBRATION=1), so budgets are enforced
+    without a model call. Estimated vs actual totals are kept per model
+    for the metrics endpoint.
+    """
+
+    def __init__(self):
+        self._chars_per_token = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def chars_per_token(self, model=None):
+        with self._lock:
+            return self._chars_per_token.get(model, CHARS_PER_TOKEN)
+
+    def estimate(self, text, model=None):
+        """Estimated tokens of a string for `model`."""
+        return int(len(text or '') / self.chars_per_token(model)) + 1
+
+    def estimate_contents(self, contents, model=None):
+        """Estimated tokens of the text parts of a generate_content request."""
+        return sum(self.estimate(part, model) for part in contents if isinstance(part, str))
+
+    def fit_contents(self, contents, max_tokens, model=None, total_tokens=None):
+        """
+        Shrink the largest text part (the transcript) until the request fits
+        `max_tokens`: first by compaction, then by cutting it at a line
+        boundary.
+
+        Args:
+            contents: generate_content contents
+            max_tokens: Input token budget
+            model: Model whose calibration sizes the cut
+            total_tokens: Exact prompt tokens from count_tokens, if known; it
+                replaces the local estimate as the measure of the overflow
+
+        Returns:
+            Tuple of (contents list, how it was shrunk: 'compacted', 'truncated' or None)
+        """
+        contents = list(contents)
+        texts = [i for i, part in enumerate(contents) if isinstance(part, str)]
+        estimated = self.estimate_contents(contents, model)
+        total = total_tokens if total_tokens is not None else estimated
+        if not texts or total <= max_tokens:
+            return contents, None
+
+        largest = max(texts, key=lambda i: len(contents[i]))
+        chars = sum(len(contents[i]) for i in texts)
+        contents[largest] = compact_text(contents[largest])
+        # Whatever compaction saved comes off the (exact or estimated) total
+        overflow = total - (estimated - self.estimate_contents(contents, model)) - max_tokens
+        if overflow <= 0:
+            return contents, 'compacted'
+
+        # An exact count also tells us this prompt's own chars per token
+        chars_per_token = chars / total if total_tokens else self.chars_per_token(model)
+        keep_chars = max(0, len(contents[largest]) - int((overflow + 1) * chars_per_token)
+                         - len(TRUNCATION_NOTE) - 1)
+        cut = contents[largest].rfind("\n", 0, keep_chars)
+        contents[largest] = contents[largest][:cut if cut > 0 else keep_chars] + "\n" + TRUNCATION_NOTE
+        return contents, 'truncated'
+
+    def calibrate(self, model, chars, actual_tokens):
+        """Move the model's chars-per-token towards what one text-only prompt measured."""
+        if not chars or not actual_tokens:
+            return
+        with self._lock:
+            current = self._chars_per_token.get(model, CHARS_PER_TOKEN)
+            self._chars_per_token[model] = (1 - CALIBRATION_ALPHA) * current + CALIBRATION_ALPHA * chars / actual_tokens
+
+    def record(self, model, estimated_tokens, actual_tokens=None, shrunk=None, output_truncated=False):
+        """Count one call's estimated vs actual prompt tokens and any budget enforcement."""
+        with self._lock:
+            stats = self._stats.setdefault(model, {
+                "calls": 0, "estimated_tokens": 0, "actual_tokens": 0,
+                "compacted": 0, "truncated": 0, "max_tokens_finishes": 0,
+            })
+            stats["calls"] += 1
+            stats["estimated_tokens"] += estimated_tokens
+            stats["actual_tokens"] += actual_tokens or 0
+            if shrunk:
+                stats[shrunk] += 1
+            if output_truncated:
+                stats["max_tokens_finishes"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                model: dict(stats, chars_per_token=round(self._chars_per_token.get(model, CHARS_PER_TOKEN), 2))
+                for model, stats in self._stats.items()
+            }
+
+
+token_budget = TokenBudget()
@@ -0,0 +1,209 @@
+import os
+import time
+import threading
+
+# Latency is smoothed per endpoint and model with this weight for the newest call
+EWMA_ALPHA = 0.3
+# Calls faster than this many seconds never count as a latency spike
+SPIKE_FLOOR_SECONDS = 2.0
+
+
+def response_tokens(response):
+    """Total (prompt + output) tokens a generate_content response reports, or None."""
+    return getattr(getattr(response, 'usage_metadata', None), 'total_token_count', None)
+
+
+def parse_endpoints(spec):
+    """
+    Parse VERTEX_ENDPOINTS: comma-separated project:location entries, each
+    with an optional =weight, e.g. "proj-a:us-central1=2,proj-b:europe-west4".
+
+    Returns:
+        List of dicts with project, location and weight
+    """
+    endpoints = []
+    for entry in (spec or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        target, _, weight = entry.partition('=')
+        project, _, location = target.partition(':')
+        if not project or not location:
+            raise ValueError(f"Invalid VERTEX_ENDPOINTS entry '{entry}', expected project:location[=weight]")
+        endpoints.append({"project": project, "location": location, "weight": float(weight or 1)})
+    return endpoints
+
+
+def is_quota_error(error):
+    """True for 429 / RESOURCE_EXHAUSTED errors from the Gemini API."""
+    return getattr(error, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(error)
+
+
+class Endpoint:
+    """One Gemini client (project + location) and its live load and health."""
+
+    def __init__(self, name, client, weight=1.0):
+        self.name = name
+        self.client = client
+        self.weight = weight
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.quota_errors = 0
+        self.ewma = {}  # model -> smoothed seconds per 1k tokens
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    def load(self):
+        return (self.in_flight + 1) / self.weight
+
+    def stats(self, now):
+        return {
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "quota_errors": self.quota_errors,
+            "seconds_per_1k_tokens": {model: round(value, 3) for model, value in self.ewma.items()},
+            "ejected_for": round(max(0.0, self.ejected_until - now), 1),
+            "ejections": self.ejections,
+        }
+
+
+class VertexClientPool:
+    """
+    Gemini clients across several Vertex AI projects/locations, so
+    throughput is bounded by the sum of their quotas rather than one region.
+
+    Each call goes to the least-loaded healthy endpoint (in-flight calls
+    divided by weight). An endpoint is taken out of rotation after a quota
+    error (for VERTEX_EJECT_SECONDS, doubling while errors repeat) or when
+    its smoothed latency per 1k tokens for a model exceeds
+    VERTEX_LATENCY_EJECT_FACTOR times the fastest healthy endpoint's for the
+    same model. Only calls that name their model and report token usage
+    (generate_content) feed the latency; count_tokens and the like do not.
+    Quota errors are retried once on another endpoint.
+    """
+
+    def __init__(self, endpoints):
+        if not endpoints:
+            raise ValueError("VertexClientPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.eject_seconds = float(os.getenv('VERTEX_EJECT_SECONDS', 60))
+        self.latency_factor = float(os.getenv('VERTEX_LATENCY_EJECT_FACTOR', 3))
+        self._lock = threading.Lock()
+        self._next = 0
+
+    @classmethod
+    def from_env(cls, http_options=None):
+        """
+        Build the pool from the environment: VERTEX_ENDPOINTS if set, else
+        GOOGLE_CLOUD_PROJECT/GOOGLE_CLOUD_LOCATION, else a single API-key client.
+        """
+        from google import genai
+
+        specs = parse_endpoints(os.getenv('VERTEX_ENDPOINTS'))
+        if not specs and os.getenv('GOOGLE_CLOUD_PROJECT'):
+            specs = [{
+                "project": os.getenv('GOOGLE_CLOUD_PROJECT'),
+                "location": os.getenv('GOOGLE_CLOUD_LOCATION', 'us-central1'),
+                "weight": 1.0,
+            }]
+
+        if not specs:
+            print("WARNING: GOOGLE_CLOUD_PROJECT not found. Falling back to simple API key (native video URL parsing will fail).")
+            api_key = os.getenv('GOOGLE_API_KEY')
+            if not api_key:
+                raise ValueError("Neither GOOGLE_CLOUD_PROJECT nor GOOGLE_API_KEY found in environment variables")
+            return cls([Endpoint('api-key', genai.Client(api_key=api_key, http_options=http_options))])
+
+        return cls([
+            Endpoint(
+                f"{spec['project']}/{spec['location']}",
+                genai.Client(vertexai=True, project=spec['project'], location=spec['location'],
+                             http_options=http_options),
+                weight=spec['weight']
+            )
+            for spec in specs
+        ])
+
+    def _acquire(self, exclude=None):
+        """Pick the least-loaded healthy endpoint and count the call against it."""
+        with self._lock:
+            now = time.time()
+            candidates = [e for e in self.endpoints if e is not exclude] or self.endpoints
+            healthy = [e for e in candidates if e.ejected_until <= now]
+            if healthy:
+                # Rotate the starting point so equally loaded endpoints share traffic
+                self._next = (self._next + 1) % len(healthy)
+                ordered = healthy[self._next:] + healthy[:self._next]
+                endpoint = min(ordered, key=Endpoint.load)
+            else:
+                # Everything is ejected: use whichever comes back first
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint, seconds, error=None, model=None, tokens=None):
+        with self._lock:
+            endpoint.in_flight -= 1
+            now = time.time()
+            if error is not None:
+                endpoint.errors += 1
+                if is_quota_error(error):
+                    endpoint.quota_errors += 1
+                    # Back off longer while the endpoint keeps hitting its quota
+                    recently_ejected = endpoint.ejected_until > now - self.eject_seconds
+                    endpoint.ejections = endpoint.ejections + 1 if recently_ejected else 1
+                    backoff = self.eject_seconds * 2 ** min(endpoint.ejections - 1, 4)
+                    endpoint.ejected_until = now + backoff
+                    print(f"DEBUG - Vertex pool: {endpoint.name} hit its quota, out of rotation for {backoff:.0f}s")
+                return
+
+            if model is None or not tokens:
+                return
+            rate = seconds * 1000 / tokens
+            previous = endpoint.ewma.get(model)
+            endpoint.ewma[model] = rate if previous is None else EWMA_ALPHA * rate + (1 - EWMA_ALPHA) * previous
+            others = [e.ewma[model] for e in self.endpoints
+                      if e is not endpoint and model in e.ewma and e.ejected_until <= now]
+            if others and seconds > SPIKE_FLOOR_SECONDS and endpoint.ewma[model] > self.latency_factor * min(others):
+                endpoint.ejected_until = now + self.eject_seconds / 2
+                # Start fresh when it comes back rather than carrying the spike
+                endpoint.ewma.pop(model)
+                print(f"DEBUG - Vertex pool: {endpoint.name} latency spike, out of rotation "
+                      f"for {self.eject_seconds / 2:.0f}s")
+
+    def call(self, fn, model=None):
+        """
+        Run `fn(client)` on a pooled client.
+
+        Args:
+            fn: Function of the client making one API call
+            model: Model of a generate_content call, to track its latency per
+                token; None for calls that should not count (e.g. count_tokens)
+
+        Returns:
+            Whatever fn returns
+        """
+        endpoint = self._acquire()
+        for attempt in range(2):
+            started = time.perf_counter()
+            try:
+                result = fn(endpoint.client)
+            except Exception as e:
+                self._release(endpoint, time.perf_counter() - started, error=e)
+                if attempt == 0 and is_quota_error(e) and len(self.endpoints) > 1:
+                    endpoint = self._acquire(exclude=endpoint)
+                    continue
+                raise
+            self._release(endpoint, time.perf_counter() - started, model=model,
+                          tokens=response_tokens(result) if model else None)
+            return result
+
+    def stats(self):
+        """Per-endpoint load, errors, latency and ejection state."""
+        with self._lock:
+            now = time.time()
+            return {e.name: e.stats(now) for e in self.endpoints}
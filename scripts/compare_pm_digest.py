@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Quality check for the extractive PM digest.
+
+For each video, runs analyze_pm_insights on the full transcript and on the
+token-budgeted digest, then reports prompt size, latency and how closely the
+two insight lists agree. Needs the same credentials as the backend (.env).
+
+Agreement is measured locally: each insight (title + description) becomes a
+TF-IDF vector, and every full-transcript insight is paired with its most
+similar digest insight. An insight counts as "matched" above --threshold.
+
+Usage:
+    python scripts/compare_pm_digest.py https://youtu.be/VIDEO_ID
+    python scripts/compare_pm_digest.py VIDEO_ID_1 VIDEO_ID_2 --budget 4000 --json report.json
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+from dotenv import load_dotenv
+
+from services.youtube_service import YouTubeService
+from services.ai_service import AIService
+from services.expression_prefilter import STOPWORDS
+from services.transcript_digest import build_pm_digest, estimate_tokens
+
+
+def insight_similarity(full_insights, digest_insights):
+    """
+    Cosine similarity between every full-transcript insight (rows) and every
+    digest insight (columns), over shared TF-IDF vectors.
+    """
+    texts = [f"{i.get('title', '')} {i.get('description', '')}".lower()
+             for i in full_insights + digest_insights]
+    tokens = [[t for t in re.findall(r"[a-z][a-z']+", text) if t not in STOPWORDS] for text in texts]
+    vocab = {t: j for j, t in enumerate(sorted({t for doc in tokens for t in doc}))}
+    if not vocab:
+        return np.zeros((len(full_insights), len(digest_insights)))
+
+    counts = np.zeros((len(texts), len(vocab)))
+    for i, doc in enumerate(tokens):
+        for t in doc:
+            counts[i, vocab[t]] += 1
+    idf = np.log((1 + len(texts)) / (1 + np.count_nonzero(counts, axis=0))) + 1
+    vectors = counts * idf
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors[:len(full_insights)] @ vectors[len(full_insights):].T
+
+
+def timed_insights(ai, transcript_text):
+    started = time.perf_counter()
+    insights = ai.analyze_pm_insights(transcript_text=transcript_text)
+    return insights, time.perf_counter() - started
+
+
+def compare_video(yt, ai, video, budget, threshold):
+    video_id = yt.extract_video_id(video) if yt.validate_url(video) else video
+    transcript = yt.get_transcript(video_id)
+    if transcript.get('fallback_needed'):
+        raise ValueError("No captions available; the digest only applies to transcripts")
+
+    digest = build_pm_digest(transcript['transcript'], token_budget=budget)
+    full_insights, full_seconds = timed_insights(ai, transcript['full_text'])
+    digest_insights, digest_seconds = timed_insights(ai, digest['text'])
+
+    similarity = insight_similarity(full_insights, digest_insights)
+    best = similarity.max(axis=1) if similarity.size else np.zeros(len(full_insights))
+    pairs = []
+    for i, insight in enumerate(full_insights):
+        j = int(similarity[i].argmax()) if similarity.size else None
+        pairs.append({
+            "full": insight.get('title'),
+            "digest": digest_insights[j].get('title') if j is not None else None,
+            "similarity": round(float(best[i]), 3),
+        })
+
+    return {
+        "video_id": video_id,
+        "tokens": {"full": estimate_tokens(transcript['full_text']), "digest": digest['tokens']},
+        "windows": {"kept": digest['windows_kept'], "total": digest['windows_total']},
+        "seconds": {"full": round(full_seconds, 2), "digest": round(digest_seconds, 2)},
+        "mean_similarity": round(float(best.mean()), 3) if best.size else 0.0,
+        "matched": int((best >= threshold).sum()),
+        "insights": len(full_insights),
+        "pairs": pairs,
+    }
+
+
+def print_report(report):
+    print(f"\n=== {report['video_id']} ===")
+    print(f"Prompt tokens : {report['tokens']['full']:>7} full  -> {report['tokens']['digest']:>7} digest "
+          f"({report['windows']['kept']}/{report['windows']['total']} windows)")
+    print(f"Latency       : {report['seconds']['full']:>7.2f}s full -> {report['seconds']['digest']:>7.2f}s digest")
+    print(f"Agreement     : {report['matched']}/{report['insights']} matched, "
+          f"mean similarity {report['mean_similarity']:.3f}")
+    for pair in report['pairs']:
+        print(f"  {pair['similarity']:.2f}  {pair['full']}\n        ~ {pair['digest']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('videos', nargs='+', help='YouTube URLs or video IDs')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='Digest token budget (default: PM_DIGEST_TOKEN_BUDGET or 6000)')
+    parser.add_argument('--threshold', type=float, default=0.3,
+                        help='Similarity above which two insights count as the same (default 0.3)')
+    parser.add_argument('--json', metavar='PATH', help='Also write the full report as JSON')
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(BACKEND_DIR, '.env'))
+    yt = YouTubeService()
+    ai = AIService()
+
+    reports = []
+    for video in args.videos:
+        try:
+            report = compare_video(yt, ai, video, args.budget, args.threshold)
+        except Exception as e:
+            print(f"ERROR - {video}: {str(e)}")
+            continue
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+    return 0 if reports else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
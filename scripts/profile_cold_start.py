@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Cold-start import profile for the Vercel entry point (api/index.py).
+
+Runs `python -X importtime` on the entry module in a fresh interpreter and
+reports the slowest imports. Used in CI to catch regressions where a heavy
+SDK gets imported at module load again.
+
+Usage:
+    python scripts/profile_cold_start.py
+    python scripts/profile_cold_start.py --top 30 --max-ms 400
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(REPO_ROOT, 'api')
+
+# Modules that must only be imported lazily, on first use
+FORBIDDEN_AT_COLD_START = [
+    'google.genai',
+    'googleapiclient.discovery',
+    'notion_client',
+    'requests',
+]
+
+
+def run_importtime(module):
+    """
+    Import `module` in a fresh interpreter with -X importtime.
+
+    Args:
+        module: Module name to import (relative to api/)
+
+    Returns:
+        List of (self_us, cumulative_us, name) tuples in import order
+    """
+    env = dict(os.environ)
+    # Mirror the serverless environment so dotenv is skipped like in production
+    env['VERCEL'] = '1'
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=API_DIR,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        # importtime output precedes the traceback; show only the traceback
+        tail = [l for l in proc.stderr.splitlines() if not l.startswith('import time:')]
+        raise RuntimeError(f"Importing {module} failed:\n" + "\n".join(tail))
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile cold-start imports of the API entry point.")
+    parser.add_argument('--module', default='index', help="Entry module inside api/ (default: index)")
+    parser.add_argument('--top', type=int, default=20, help="Number of slowest imports to list")
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help="Fail if the entry module's cumulative import time exceeds this")
+    args = parser.parse_args()
+
+    try:
+        entries = run_importtime(args.module)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    total_us = next((cum for _, cum, name in entries if name.strip() == args.module), 0)
+    imported = {name.strip() for _, _, name in entries}
+
+    print(f"Cold-start import profile for api/{args.module}.py")
+    print(f"Total: {total_us / 1000:.1f} ms across {len(entries)} modules\n")
+    print(f"{'cumulative ms':>14}  {'self ms':>8}  module")
+    for self_us, cum_us, name in sorted(entries, key=lambda e: e[1], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:>14.1f}  {self_us / 1000:>8.1f}  {name}")
+
+    failed = False
+    eager = [m for m in FORBIDDEN_AT_COLD_START if m in imported]
+    if eager:
+        print(f"\nERROR: imported at cold start (should be lazy): {', '.join(eager)}", file=sys.stderr)
+        failed = True
+    if args.max_ms is not None and total_us / 1000 > args.max_ms:
+        print(f"\nERROR: cold-start import time {total_us / 1000:.1f} ms exceeds budget of {args.max_ms} ms",
+              file=sys.stderr)
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
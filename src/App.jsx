@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useState, useEffect } from 'react'
 import { ArrowRight } from 'lucide-react'
 import { motion } from 'motion/react'
 import Results from './components/Results'
@@ -14,6 +14,35 @@ function App() {
   const [error, setError] = useState(null)
   const [analysisData, setAnalysisData] = useState(null)
 
+  // Restore a stored analysis from a shared/refreshed link (?v=VIDEO_ID).
+  // The GET endpoint is cacheable, so repeat visits are served by the browser/CDN.
+  useEffect(() => {
+    const videoId = new URLSearchParams(window.location.search).get('v')
+    if (!videoId || window.location.pathname === '/notion-callback') return
+
+    const loadStoredAnalysis = async () => {
+      setLoading(true)
+      setLoadingMessage('Loading saved analysis...')
+      try {
+        const response = await fetch(`${API_URL}/api/analysis/${encodeURIComponent(videoId)}`)
+        const data = await response.json()
+        if (response.ok && data.success) {
+          setAnalysisData(data)
+          setYoutubeLink(data.video?.url || '')
+        } else {
+          window.history.replaceState(null, '', window.location.pathname)
+        }
+      } catch (err) {
+        setError(err.message)
+      } finally {
+        setLoading(false)
+        setLoadingMessage('')
+      }
+    }
+
+    loadStoredAnalysis()
+  }, [])
+
   const handleSubmit = async (e) => {
     e.preventDefault()
 
@@ -45,6 +74,9 @@ function App() {
 
       if (data.success) {
         setAnalysisData(data)
+        if (data.video?.id) {
+          window.history.replaceState(null, '', `?v=${encodeURIComponent(data.video.id)}`)
+        }
       } else {
         throw new Error(data.error || 'Analysis failed')
       }
@@ -92,6 +124,7 @@ function App() {
         onBack={() => {
           setAnalysisData(null)
           setYoutubeLink('')
+          window.history.replaceState(null, '', window.location.pathname)
         }}
       />
     )
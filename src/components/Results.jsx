@@ -56,6 +56,26 @@ export default function Results({ data, onBack }) {
         }
     }
 
+    const waitForJob = async (jobId) => {
+        // Give up after 10 minutes; the server fails jobs whose worker died
+        const deadline = Date.now() + 10 * 60 * 1000
+        while (Date.now() < deadline) {
+            await new Promise((resolve) => setTimeout(resolve, 1500))
+            const response = await fetch(`${API_URL}/api/jobs/${jobId}`)
+            const job = await response.json()
+            if (!response.ok) {
+                throw new Error(job.error || 'Export failed')
+            }
+            if (job.status === 'succeeded') {
+                return { success: true, ...job.result }
+            }
+            if (job.status === 'failed') {
+                return { success: false, error: job.error }
+            }
+        }
+        throw new Error('Export is taking too long. Please try again later.')
+    }
+
     const handleExportToNotion = async () => {
         setIsExporting(true)
         setExportError(null)
@@ -71,24 +91,38 @@ export default function Results({ data, onBack }) {
             return
         }
 
+        const requestExport = (body) => fetch(`${API_URL}/api/export/notion`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ ...body, access_token: accessToken })
+        })
+
         try {
-            const response = await fetch(`${API_URL}/api/export/notion`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    analysis_data: data,
-                    access_token: accessToken
-                })
-            })
+            // Stored analyses are exported by ID; the server already has the payload
+            let response = await requestExport(data.analysis_id
+                ? { analysis_id: data.analysis_id }
+                : { analysis_data: data })
+            let result = await response.json()
 
-            const result = await response.json()
+            // The store is per instance on serverless deployments, so another
+            // instance (or a cold start) may not have it: send the payload too,
+            // keeping the ID so the export still updates its earlier page
+            if (result.error_code === 'analysis_not_found' && data.analysis_id) {
+                response = await requestExport({ analysis_id: data.analysis_id, analysis_data: data })
+                result = await response.json()
+            }
 
             if (!response.ok) {
                 throw new Error(result.error || 'Export failed')
             }
 
+            // Exports run as background jobs; poll until the page is ready
+            if (response.status === 202 && result.job_id) {
+                result = await waitForJob(result.job_id)
+            }
+
             if (result.success) {
                 setNotionUrl(result.notion_url)
             } else {
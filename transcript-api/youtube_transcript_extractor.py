@@ -7,14 +7,31 @@ Usage:
     python youtube_transcript_extractor.py <youtube_url>
     python youtube_transcript_extractor.py <youtube_url> --output <filename>
 
+Batch mode (one URL, video ID or playlist ID/URL per line; "-" reads stdin):
+    python youtube_transcript_extractor.py --batch urls.txt --output transcripts.jsonl
+    cat urls.txt | python youtube_transcript_extractor.py --batch - --workers 8 --rate 4
+
+    Each result is written as one JSON line with the video's segments
+    (text, start, duration) as soon as it is fetched. Finished videos are
+    recorded in a checkpoint file (default: <output>.checkpoint), and a
+    re-run with the same arguments skips them.
+
 Or import as a module:
     from youtube_transcript_extractor import extract_transcript
     transcript = extract_transcript("https://www.youtube.com/watch?v=...")
 """
 
+import os
 import re
 import sys
-from typing import Optional
+import json
+import time
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator, List, Optional
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import (
     TranscriptsDisabled,
@@ -52,6 +69,76 @@ def extract_video_id(url: str) -> Optional[str]:
     return None
 
 
+def extract_playlist_id(entry: str) -> Optional[str]:
+    """
+    Extract a playlist ID from a playlist URL (list=...) or a bare playlist ID.
+
+    Args:
+        entry: URL or ID string
+
+    Returns:
+        Playlist ID string or None if the entry is not a playlist
+    """
+    match = re.search(r'[?&]list=([a-zA-Z0-9_-]+)', entry)
+    if match:
+        return match.group(1)
+    if re.fullmatch(r'(?:PL|UU|LL|FL|OL|RD)[a-zA-Z0-9_-]{10,}', entry):
+        return entry
+    return None
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests to each host so that at most `rate` requests per
+    second are started against it, however many threads are fetching.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def list_playlist_videos(playlist_id: str, limiter: HostRateLimiter) -> List[str]:
+    """
+    List the video IDs of a playlist with the YouTube Data API.
+
+    Requires GOOGLE_API_KEY in the environment.
+
+    Args:
+        playlist_id: YouTube playlist ID
+        limiter: Rate limiter shared with the transcript fetches
+
+    Returns:
+        Video IDs in playlist order
+    """
+    api_key = os.getenv('GOOGLE_API_KEY')
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY is required to expand playlists")
+
+    video_ids, page_token = [], None
+    while True:
+        params = {"part": "contentDetails", "maxResults": 50, "playlistId": playlist_id, "key": api_key}
+        if page_token:
+            params["pageToken"] = page_token
+        limiter.wait("www.googleapis.com")
+        url = "https://www.googleapis.com/youtube/v3/playlistItems?" + urllib.parse.urlencode(params)
+        with urllib.request.urlopen(url, timeout=30) as response:
+            page = json.load(response)
+        video_ids.extend(item["contentDetails"]["videoId"] for item in page.get("items", []))
+        page_token = page.get("nextPageToken")
+        if not page_token:
+            return video_ids
+
+
 def format_timestamp(seconds: float) -> str:
     """
     Convert seconds to readable timestamp format.
@@ -127,6 +214,132 @@ def extract_transcript(url: str, languages: list = ['en']) -> str:
     return '\n'.join(formatted_lines)
 
 
+def fetch_segments(video_id: str, languages: list = ['en']) -> List[dict]:
+    """
+    Fetch a video's transcript as raw segments.
+
+    Args:
+        video_id: YouTube video ID
+        languages: List of language codes to try (default: ['en'])
+
+    Returns:
+        List of {"text", "start", "duration"} dicts
+    """
+    fetched_transcript = YouTubeTranscriptApi().fetch(video_id, languages=tuple(languages))
+    return [
+        {"text": snippet.text.strip(), "start": snippet.start, "duration": snippet.duration}
+        for snippet in fetched_transcript.snippets
+    ]
+
+
+def read_entries(source: str) -> Iterator[str]:
+    """Non-empty, non-comment lines of a file, or of stdin for "-"."""
+    stream = sys.stdin if source == '-' else open(source, encoding='utf-8')
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def resolve_video_ids(entries: Iterable[str], limiter: HostRateLimiter) -> List[str]:
+    """
+    Turn URLs, video IDs and playlists into a de-duplicated list of video IDs.
+    Entries that cannot be resolved are reported on stderr and skipped.
+    """
+    video_ids, seen = [], set()
+    for entry in entries:
+        playlist_id = extract_playlist_id(entry)
+        # A watch URL inside a playlist names one video; only bare playlists expand
+        video_id = extract_video_id(entry) or (entry if re.fullmatch(r'[a-zA-Z0-9_-]{11}', entry) else None)
+        try:
+            ids = [video_id] if video_id else list_playlist_videos(playlist_id, limiter) if playlist_id else []
+        except Exception as e:
+            print(f"Error: could not expand playlist {playlist_id}: {e}", file=sys.stderr)
+            continue
+        if not ids:
+            print(f"Error: not a YouTube video or playlist: {entry}", file=sys.stderr)
+        for vid in ids:
+            if vid not in seen:
+                seen.add(vid)
+                video_ids.append(vid)
+    return video_ids
+
+
+def run_batch(entries: Iterable[str], output: Optional[str] = None, checkpoint: Optional[str] = None,
+              workers: int = 4, rate: float = 2.0, languages: list = ['en']) -> dict:
+    """
+    Fetch transcripts for many videos and stream them as JSONL.
+
+    Videos are fetched on a bounded thread pool; requests to each host are
+    rate limited. Each result is one line: {"video_id", "segments"} or, if
+    the video has no usable transcript, {"video_id", "error"}. Videos with a
+    result are appended to the checkpoint file and skipped on the next run;
+    transient failures are left out so that a re-run retries them.
+
+    Args:
+        entries: Video URLs, video IDs, playlist URLs or playlist IDs
+        output: JSONL file to append to (default: stdout)
+        checkpoint: Checkpoint file (default: <output>.checkpoint, none for stdout)
+        workers: Concurrent transcript fetches
+        rate: Maximum requests per second per host
+        languages: List of language codes to try
+
+    Returns:
+        Counts of fetched, skipped, unavailable and failed videos
+    """
+    limiter = HostRateLimiter(rate)
+    checkpoint = checkpoint or (f"{output}.checkpoint" if output else None)
+    done = set()
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint, encoding='utf-8') as f:
+            done = {line.strip() for line in f if line.strip()}
+
+    video_ids = resolve_video_ids(entries, limiter)
+    pending = [vid for vid in video_ids if vid not in done]
+    counts = {"fetched": 0, "skipped": len(video_ids) - len(pending), "unavailable": 0, "failed": 0}
+    print(f"Fetching {len(pending)} transcripts ({counts['skipped']} already done)", file=sys.stderr)
+
+    def fetch(video_id):
+        limiter.wait("www.youtube.com")
+        return fetch_segments(video_id, languages)
+
+    out = open(output, 'a', encoding='utf-8') if output else sys.stdout
+    progress = open(checkpoint, 'a', encoding='utf-8') if checkpoint else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(fetch, vid): vid for vid in pending}
+            for future in as_completed(futures):
+                video_id = futures[future]
+                try:
+                    record = {"video_id": video_id, "segments": future.result()}
+                    counts["fetched"] += 1
+                except (TranscriptsDisabled, NoTranscriptFound, VideoUnavailable) as e:
+                    # Permanent for this video: record it so resumes skip it
+                    record = {"video_id": video_id, "error": type(e).__name__}
+                    counts["unavailable"] += 1
+                except Exception as e:
+                    print(f"Error: {video_id}: {e}", file=sys.stderr)
+                    counts["failed"] += 1
+                    continue
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if progress:
+                    progress.write(video_id + "\n")
+                    progress.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if progress:
+            progress.close()
+
+    print(f"Done: {counts}", file=sys.stderr)
+    return counts
+
+
 def save_transcript(transcript: str, filename: str) -> None:
     """
     Save transcript to a file.
@@ -142,23 +355,36 @@ def save_transcript(transcript: str, filename: str) -> None:
 
 def main():
     """Command-line interface for the transcript extractor."""
-    if len(sys.argv) < 2:
-        print("Usage: python youtube_transcript_extractor.py <youtube_url> [--output <filename>]")
+    parser = argparse.ArgumentParser(description="Extract timestamped transcripts from YouTube videos.")
+    parser.add_argument("url", nargs="?", help="YouTube video URL")
+    parser.add_argument("--output", help="Output file (text for one URL, JSONL in batch mode)")
+    parser.add_argument("--batch", metavar="FILE", help='File of URLs/video IDs/playlists, one per line ("-" for stdin)')
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent fetches in batch mode (default: 4)")
+    parser.add_argument("--rate", type=float, default=2.0, help="Max requests per second per host (default: 2)")
+    parser.add_argument("--checkpoint", help="Checkpoint file for resuming (default: <output>.checkpoint)")
+    parser.add_argument("--languages", default="en", help="Comma-separated language codes to try (default: en)")
+    args = parser.parse_args()
+    languages = [code.strip() for code in args.languages.split(',') if code.strip()]
+
+    if args.batch:
+        counts = run_batch(read_entries(args.batch), output=args.output, checkpoint=args.checkpoint,
+                           workers=args.workers, rate=args.rate, languages=languages)
+        sys.exit(1 if counts["failed"] else 0)
+
+    if not args.url:
+        parser.print_usage()
         print("\nExample:")
         print("  python youtube_transcript_extractor.py 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'")
         print("  python youtube_transcript_extractor.py 'https://youtu.be/dQw4w9WgXcQ' --output transcript.txt")
+        print("  python youtube_transcript_extractor.py --batch urls.txt --output transcripts.jsonl")
         sys.exit(1)
 
-    url = sys.argv[1]
-    output_file = None
-
-    # Check for --output flag
-    if len(sys.argv) >= 4 and sys.argv[2] == '--output':
-        output_file = sys.argv[3]
+    url = args.url
+    output_file = args.output
 
     try:
         print(f"Extracting transcript from: {url}")
-        transcript = extract_transcript(url)
+        transcript = extract_transcript(url, languages)
 
         if output_file:
             save_transcript(transcript, output_file)